@@ -1,9 +1,23 @@
 from __future__ import print_function
 import shelve
 
+import numpy as np
+
 import libtcodpy as libtcod
 import objects as o
 import globals as g
+import explore
+import fov
+import chunks
+import layers
+import levels
+import mapgen
+import movement
+import pathfinding
+import prefabs
+import regions
+import spatial
+import storage
 
 
 class Rect:
@@ -14,9 +28,13 @@ class Rect:
         self.x2 = x + w
         self.y2 = y + h
 
+        # where a prefab stamped into the room wants its monsters and items
+        self.monster_spots = []
+        self.item_spots = []
+
     def center(self):
-        center_x = (self.x1 + self.x2) / 2
-        center_y = (self.y1 + self.y2) / 2
+        center_x = (self.x1 + self.x2) // 2
+        center_y = (self.y1 + self.y2) // 2
         return (center_x, center_y)
 
     def intersect(self, other):
@@ -38,32 +56,99 @@ class Tile:
 
 tile_map = None
 fov_map = None
+sight_map = None
+walk_map = None
+visible = None
+perception = None
 fov_recompute = None
+redraw_all = True
+dirty_tiles = []  # tiles whose colour changed since they were last drawn
+fov_origin = None
 objects = None
 player = None
+stairs = None
+upstairs = None
+level_cache = None
+population = 0
 con = None
+frontier = None
+planner = None
+jump_paths = None
+world = None
+region_map = None
+repeat_count = 0
+turn = 0
 MAX_OPTIONS = 26
 dungeon_level = 1
+game_seed = 0
+
+
+def create_room(room, blocked, block_sight):
+    # make the tiles inside the rectangle passable
+    blocked[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = False
+    block_sight[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = False
 
 
-def create_room(room):
-    global tile_map
-    # go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            tile_map[x][y].blocked = False
-            tile_map[x][y].block_sight = False
+def furnish_room(room, blocked, block_sight):
+    # now and then, stamp a prefab that fits inside the room into its middle
+    if libtcod.random_get_int(0, 1, 100) > g.PREFAB_CHANCE:
+        return
+    candidates = prefabs.library(g.PREFAB_DIRECTORY).fitting(room.x2 - room.x1 - 1, room.y2 - room.y1 - 1)
+    if not candidates:
+        return
+    prefab = candidates[libtcod.random_get_int(0, 0, len(candidates) - 1)]
+
+    (center_x, center_y) = room.center()
+    x = max(room.x1 + 1, min(center_x - prefab.width // 2, room.x2 - prefab.width))
+    y = max(room.y1 + 1, min(center_y - prefab.height // 2, room.y2 - prefab.height))
+    prefab.stamp(blocked, block_sight, x, y)
+
+    room.monster_spots = [(x + spot_x, y + spot_y) for (spot_x, spot_y) in prefab.monster_spots]
+    room.item_spots = [(x + spot_x, y + spot_y) for (spot_x, spot_y) in prefab.item_spots]
 
 
 def make_map():
-    global tile_map, objects, stairs
+    global population, region_map
+    # generate a new level with the configured generator
+    seed_level()
+    region_map = None
+    if g.MAP_GENERATOR == 'caves':
+        make_cave_map()
+    elif g.MAP_GENERATOR == 'bsp':
+        make_bsp_map()
+    else:
+        make_room_map()
+
+    # how many monsters the level had to begin with, it refills up to that while the player is away
+    population = sum(1 for obj in objects if obj.ai)
+
+
+def seed_level():
+    # a level is made from the game's seed and its depth alone, so a seed always gives the same level at the same
+    # depth, whatever happened before (see catalogue.py)
+    rng = libtcod.random_new_from_seed((game_seed * 1009 + dungeon_level) % 0x100000000)
+    libtcod.random_restore(libtcod.random_get_instance(), rng)
+    libtcod.random_delete(rng)
+
+
+def generate_level(seed, depth):
+    global player, game_seed, dungeon_level
+    # make the level a game with this seed gets at this depth, without a window or a game around it
+    player = create_player()
+    game_seed = seed
+    dungeon_level = depth
+    make_map()
+
+
+def make_room_map():
+    global tile_map, objects, stairs, region_map
 
-    # fill map with "blocked" tiles
-    tile_map = [[Tile(True)
-                 for y in range(g.MAP_HEIGHT)]
-                for x in range(g.MAP_WIDTH)]
+    # fill map with "blocked" tiles. the map is carved as arrays, and made of tiles once it's done
+    blocked = np.ones((g.MAP_WIDTH, g.MAP_HEIGHT), dtype=bool)
+    block_sight = np.ones((g.MAP_WIDTH, g.MAP_HEIGHT), dtype=bool)
+    room_map = np.full((g.MAP_WIDTH, g.MAP_HEIGHT), -1, dtype=np.int32)  # which room every tile is in
 
-    objects = [player]
+    objects = layers.Layers([player])
 
     rooms = []
     num_rooms = 0
@@ -92,7 +177,9 @@ def make_map():
             # this means there are no intersections, so this room is valid
 
             # "paint" it to the map's tiles
-            create_room(new_room)
+            create_room(new_room, blocked, block_sight)
+            furnish_room(new_room, blocked, block_sight)
+            room_map[new_room.x1 + 1:new_room.x2, new_room.y1 + 1:new_room.y2] = num_rooms
 
             # center coordinates of new room, will be useful later
             (new_x, new_y) = new_room.center()
@@ -111,73 +198,321 @@ def make_map():
                 # draw a coin (random number that is either 0 or 1)
                 if libtcod.random_get_int(0, 0, 1) == 1:
                     # first move horizontally, then vertically
-                    create_h_tunnel(prev_x, new_x, prev_y)
-                    create_v_tunnel(prev_y, new_y, new_x)
+                    create_h_tunnel(prev_x, new_x, prev_y, blocked, block_sight)
+                    create_v_tunnel(prev_y, new_y, new_x, blocked, block_sight)
                 else:
                     # first move vertically, then horizontally
-                    create_v_tunnel(prev_y, new_y, prev_x)
-                    create_h_tunnel(prev_x, new_x, new_y)
+                    create_v_tunnel(prev_y, new_y, prev_x, blocked, block_sight)
+                    create_h_tunnel(prev_x, new_x, new_y, blocked, block_sight)
 
             # finally, append the new room to the list
-            place_objects(new_room)
             rooms.append(new_room)
             num_rooms += 1
 
+    # prefabs may have cut through older tunnels: join up whatever the stairs or any spawn could be cut off in
+    mapgen.connect_floor(blocked, block_sight)
+
+    # make the tiles, then fill the rooms
+    tile_map = mapgen.tiles_from_array(blocked, block_sight, Tile)
+    region_map = regions.RegionMap(rooms, room_map, blocked)
+    occupied = blocking_spots()
+    for room in rooms:
+        place_objects(room, occupied)
+
     # create stairs at the center of the last room
     stairs = o.Object(new_x, new_y, '<', 'stairs', libtcod.white, always_visible=True)
     objects.append(stairs)
-    stairs.send_to_back(objects)  # so it's drawn below the monsters
 
 
-def create_h_tunnel(x1, x2, y):
-    global tile_map
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        tile_map[x][y].blocked = False
-        tile_map[x][y].block_sight = False
+def make_bsp_map():
+    global tile_map, objects, stairs, region_map
+    # binary space partitioning: the map is split up once, every leaf gets a room and the rooms of sibling nodes are
+    # joined by a tunnel. no room is ever tried and thrown away, and every room is connected.
+    blocked = np.ones((g.MAP_WIDTH, g.MAP_HEIGHT), dtype=bool)
+    block_sight = np.ones((g.MAP_WIDTH, g.MAP_HEIGHT), dtype=bool)
+    room_map = np.full((g.MAP_WIDTH, g.MAP_HEIGHT), -1, dtype=np.int32)  # which room every tile is in, -1 for none
+    objects = layers.Layers([player])
+    rooms = []
+    points = {}  # a point in the rooms under every node, for the tunnels to aim at
+
+    root = libtcod.bsp_new_with_size(0, 0, g.MAP_WIDTH, g.MAP_HEIGHT)
+    libtcod.bsp_split_recursive(root, 0, g.BSP_DEPTH, g.BSP_MIN_LEAF_SIZE, g.BSP_MIN_LEAF_SIZE, 1.5, 1.5)
+
+    def visit(node, data):
+        # children are visited before their parent
+        if libtcod.bsp_is_leaf(node):
+            # a random room inside the leaf, walls included
+            w = libtcod.random_get_int(0, g.ROOM_MIN_SIZE, max(g.ROOM_MIN_SIZE, min(g.ROOM_MAX_SIZE, node.w - 1)))
+            h = libtcod.random_get_int(0, g.ROOM_MIN_SIZE, max(g.ROOM_MIN_SIZE, min(g.ROOM_MAX_SIZE, node.h - 1)))
+            x = libtcod.random_get_int(0, node.x, max(node.x, node.x + node.w - w - 1))
+            y = libtcod.random_get_int(0, node.y, max(node.y, node.y + node.h - h - 1))
+            room = Rect(x, y, w, h)
+
+            create_room(room, blocked, block_sight)
+            furnish_room(room, blocked, block_sight)
+            room_map[room.x1 + 1:room.x2, room.y1 + 1:room.y2] = len(rooms)
+            rooms.append(room)
+            point = room.center()
+        else:
+            # join the two halves
+            (prev_x, prev_y) = points[bsp_key(libtcod.bsp_left(node))]
+            (new_x, new_y) = points[bsp_key(libtcod.bsp_right(node))]
+            if libtcod.random_get_int(0, 0, 1) == 1:
+                create_h_tunnel(prev_x, new_x, prev_y, blocked, block_sight)
+                create_v_tunnel(prev_y, new_y, new_x, blocked, block_sight)
+                point = (prev_x, prev_y)
+            else:
+                create_v_tunnel(prev_y, new_y, prev_x, blocked, block_sight)
+                create_h_tunnel(prev_x, new_x, new_y, blocked, block_sight)
+                point = (new_x, new_y)
+        points[bsp_key(node)] = point
+        return True
+
+    libtcod.bsp_traverse_inverted_level_order(root, visit)
+    libtcod.bsp_delete(root)
+    (start_x, start_y) = rooms[0].center()
+    mapgen.connect_floor(blocked, block_sight)  # nothing may be cut off from the start
+
+    tile_map = mapgen.tiles_from_array(blocked, block_sight, Tile)
+    region_map = regions.RegionMap(rooms, room_map, blocked)
+
+    # the player starts in the first room, the stairs are in the room the most rooms away from it
+    (player.x, player.y) = (start_x, start_y)
+    occupied = blocking_spots()
+    for room in rooms:
+        place_objects(room, occupied)
+
+    hops = region_map.hops(0)
+    (stairs_x, stairs_y) = rooms[hops.index(max(hops))].center()
+    stairs = o.Object(stairs_x, stairs_y, '<', 'stairs', libtcod.white, always_visible=True)
+    objects.append(stairs)
+
+
+def bsp_key(node):
+    # the python side gets a new wrapper for every visit, nodes are told apart by their rectangle
+    return node.x, node.y, node.w, node.h
+
+
+def make_cave_map():
+    global tile_map, objects, stairs, region_map
+    # cellular automata caves (see mapgen.make_cave), populated as if they were made of room-sized areas
+    blocked = mapgen.make_cave(g.MAP_WIDTH, g.MAP_HEIGHT, libtcod.random_get_int(0, 0, 0x7fffffff))
+    tile_map = mapgen.tiles_from_array(blocked, blocked, Tile)
+    region_map = regions.RegionMap([], np.full(blocked.shape, -1, dtype=np.int32), blocked)  # caves have no rooms
+    objects = layers.Layers([player])
+
+    floor = mapgen.floor_tiles(blocked)
+    (player.x, player.y) = floor[libtcod.random_get_int(0, 0, len(floor) - 1)]
+
+    occupied = blocking_spots()
+    for i in range(len(floor) // g.CAVE_TILES_PER_AREA):
+        (x, y) = floor[libtcod.random_get_int(0, 0, len(floor) - 1)]
+        place_objects(Rect(x - g.ROOM_MIN_SIZE // 2, y - g.ROOM_MIN_SIZE // 2, g.ROOM_MIN_SIZE, g.ROOM_MIN_SIZE),
+                      occupied)
+
+    # stairs as far from the player as a few tries can find
+    (stairs_x, stairs_y) = (player.x, player.y)
+    for i in range(10):
+        (x, y) = floor[libtcod.random_get_int(0, 0, len(floor) - 1)]
+        if player.distance(x, y) > player.distance(stairs_x, stairs_y):
+            (stairs_x, stairs_y) = (x, y)
+    stairs = o.Object(stairs_x, stairs_y, '<', 'stairs', libtcod.white, always_visible=True)
+    objects.append(stairs)
+
+
+def make_chunk(cx, cy):
+    global tile_map, objects
+    # generate one chunk of a chunked world: a few rooms joined to its middle, which is joined to the middle of
+    # every edge that has a neighbour, so neighbouring chunks always connect. make_map's helpers work on the
+    # global tile_map and objects, so they are pointed at the new chunk for the time being.
+    (active_map, active_objects) = (tile_map, objects)
+    size = g.CHUNK_SIZE
+    blocked = np.ones((size, size), dtype=bool)
+    block_sight = np.ones((size, size), dtype=bool)
+
+    mid = size // 2
+    if cx > 0:
+        create_h_tunnel(0, mid, mid, blocked, block_sight)
+    if cx < g.WORLD_WIDTH - 1:
+        create_h_tunnel(mid, size - 1, mid, blocked, block_sight)
+    if cy > 0:
+        create_v_tunnel(0, mid, mid, blocked, block_sight)
+    if cy < g.WORLD_HEIGHT - 1:
+        create_v_tunnel(mid, size - 1, mid, blocked, block_sight)
+
+    rooms = []
+    for r in range(g.CHUNK_MAX_ROOMS):
+        w = libtcod.random_get_int(0, g.ROOM_MIN_SIZE, g.ROOM_MAX_SIZE)
+        h = libtcod.random_get_int(0, g.ROOM_MIN_SIZE, g.ROOM_MAX_SIZE)
+        # keep the chunk's border solid, except where the edge tunnels come through
+        x = libtcod.random_get_int(0, 1, size - w - 2)
+        y = libtcod.random_get_int(0, 1, size - h - 2)
+        new_room = Rect(x, y, w, h)
 
+        if any(new_room.intersect(other_room) for other_room in rooms):
+            continue
+        create_room(new_room, blocked, block_sight)
+        furnish_room(new_room, blocked, block_sight)
+        (new_x, new_y) = new_room.center()
+        create_h_tunnel(mid, new_x, mid, blocked, block_sight)
+        create_v_tunnel(mid, new_y, new_x, blocked, block_sight)
+        rooms.append(new_room)
+
+    mapgen.connect_floor(blocked, block_sight)
+    tile_map = mapgen.tiles_from_array(blocked, block_sight, Tile)
+    objects = layers.Layers()
+    occupied = set()
+    for room in rooms:
+        place_objects(room, occupied)
+
+    chunk = chunks.Chunk(cx, cy, tile_map, objects.everything())
+    for obj in chunk.objects:
+        obj.x += cx * size
+        obj.y += cy * size
+
+    (tile_map, objects) = (active_map, active_objects)
+    return chunk
+
+
+def new_world():
+    global world, stairs
+    # start a chunked world, with the player in the middle of its middle chunk
+    world = chunks.ChunkedWorld(g.WORLD_WIDTH, g.WORLD_HEIGHT, g.CHUNK_SIZE, make_chunk, g.CHUNK_DIRECTORY,
+                                g.CHUNK_RADIUS, g.MAX_LOADED_CHUNKS)
+    stairs = None  # a chunked world is a single endless level
+
+    (cx, cy) = (g.WORLD_WIDTH // 2, g.WORLD_HEIGHT // 2)
+    enter_chunk(cx, cy, [])
+    player.x = cx * g.CHUNK_SIZE + g.CHUNK_SIZE // 2 - world.origin_x
+    player.y = cy * g.CHUNK_SIZE + g.CHUNK_SIZE // 2 - world.origin_y
+    objects.append(player)
+    g.fighters.update(player)  # the index was made by enter_chunk, before the player was put in the window
+
+
+def enter_chunk(cx, cy, active_objects):
+    global tile_map, objects
+    # make the chunks around the given one the active window; the game only ever sees this window
+    (tile_map, active) = world.activate(cx, cy, active_objects)
+    objects = layers.Layers(active)
+    (g.MAP_WIDTH, g.MAP_HEIGHT) = (world.window_width, world.window_height)
+    initialize_fov()
 
-def create_v_tunnel(y1, y2, x):
-    global tile_map
+
+def stream_world():
+    # once the player walks out of the window's middle chunk, move the window along with them
+    (cx, cy) = world.chunk_at(player.x + world.origin_x, player.y + world.origin_y)
+    if (cx, cy) != world.center:
+        enter_chunk(cx, cy, objects.everything())
+        recompute_fov()
+
+
+def create_h_tunnel(x1, x2, y, blocked, block_sight):
+    blocked[min(x1, x2):max(x1, x2) + 1, y] = False
+    block_sight[min(x1, x2):max(x1, x2) + 1, y] = False
+
+
+def create_v_tunnel(y1, y2, x, blocked, block_sight):
     # vertical tunnel
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        tile_map[x][y].blocked = False
-        tile_map[x][y].block_sight = False
+    blocked[x, min(y1, y2):max(y1, y2) + 1] = False
+    block_sight[x, min(y1, y2):max(y1, y2) + 1] = False
+
+
+def recompute_fov():
+    global fov_recompute, visible, fov_origin
+    # compute FOV from the player's position and mark what is seen as explored, without drawing anything
+    fov_recompute = False
+    previous = visible
+    if g.FOV_ENGINE == 'shadowcasting':
+        visible = fov.shadowcast(sight_map, player.x, player.y, g.TORCH_RADIUS, g.FOV_LIGHT_WALLS)
+    else:
+        libtcod.map_compute_fov(fov_map, player.x, player.y, g.TORCH_RADIUS, g.FOV_LIGHT_WALLS, g.FOV_ALGO)
+        # only tiles within the torch radius can have come into view
+        visible = np.zeros((g.MAP_WIDTH, g.MAP_HEIGHT), dtype=bool)
+        radius = g.TORCH_RADIUS if g.TORCH_RADIUS > 0 else max(g.MAP_WIDTH, g.MAP_HEIGHT)
+        for y in range(max(0, player.y - radius), min(g.MAP_HEIGHT, player.y + radius + 1)):
+            for x in range(max(0, player.x - radius), min(g.MAP_WIDTH, player.x + radius + 1)):
+                visible[x, y] = libtcod.map_is_in_fov(fov_map, x, y)
+
+    # only the tiles that came into view or went out of it have to be drawn again, and only the ones that came
+    # into view can be newly explored. nothing outside the torch radius around the old and the new position changed
+    area = None
+    if fov_origin is not None and g.TORCH_RADIUS > 0:
+        area = (min(fov_origin[0], player.x) - g.TORCH_RADIUS, min(fov_origin[1], player.y) - g.TORCH_RADIUS,
+                max(fov_origin[0], player.x) + g.TORCH_RADIUS + 1, max(fov_origin[1], player.y) + g.TORCH_RADIUS + 1)
+    fov_origin = (player.x, player.y)
+    changed = fov.changed(previous, visible, area)
+    dirty_tiles.extend(changed)
+
+    newly_explored = []
+    for (x, y) in changed:
+        if visible[x, y] and not tile_map[x][y].explored:
+            tile_map[x][y].explored = True
+            newly_explored.append((x, y))
+
+    # keep the auto-explore distances up to date, if they were built for this level
+    if frontier is not None and newly_explored:
+        frontier.explore(newly_explored)
+    return newly_explored
+
+
+def move_camera(target_x, target_y):
+    global redraw_all
+    # center the camera on the target, without letting it see outside the map
+    x = max(0, min(target_x - g.CAMERA_WIDTH // 2, g.MAP_WIDTH - g.CAMERA_WIDTH))
+    y = max(0, min(target_y - g.CAMERA_HEIGHT // 2, g.MAP_HEIGHT - g.CAMERA_HEIGHT))
+
+    if x != g.camera_x or y != g.camera_y:
+        redraw_all = True  # everything on screen moved, so it all has to be drawn again
+    (g.camera_x, g.camera_y) = (x, y)
+
+
+def draw_tile(map_x, map_y):
+    # set the background color of a map tile, if it's in the camera's view
+    (x, y) = g.to_camera_coordinates(map_x, map_y)
+    if x is None:
+        return
+    wall = tile_map[map_x][map_y].block_sight
+
+    if not visible[map_x, map_y]:
+        if tile_map[map_x][map_y].explored:
+            if wall:
+                libtcod.console_set_char_background(con, x, y, g.color_dark_wall, libtcod.BKGND_SET)
+            else:
+                libtcod.console_set_char_background(con, x, y, g.color_dark_ground, libtcod.BKGND_SET)
+    else:
+        # it's visible
+        if wall:
+            libtcod.console_set_char_background(con, x, y, g.color_light_wall, libtcod.BKGND_SET)
+        else:
+            libtcod.console_set_char_background(con, x, y, g.color_light_ground, libtcod.BKGND_SET)
 
 
 def render_all():
-    global fov_map, fov_recompute
+    global fov_map, fov_recompute, redraw_all
+
+    move_camera(player.x, player.y)
 
     if fov_recompute:
         # recompute FOV if needed (the player moved or something)
-        fov_recompute = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, g.TORCH_RADIUS, g.FOV_LIGHT_WALLS, g.FOV_ALGO)
-
-        # go through all tiles, and set their background color
-        for y in range(g.MAP_HEIGHT):
-            for x in range(g.MAP_WIDTH):
+        recompute_fov()
+
+    if redraw_all:
+        # go through the tiles in the camera's view, and set their background color
+        redraw_all = False
+        libtcod.console_clear(con)
+        for y in range(min(g.CAMERA_HEIGHT, g.MAP_HEIGHT - g.camera_y)):
+            for x in range(min(g.CAMERA_WIDTH, g.MAP_WIDTH - g.camera_x)):
+                draw_tile(g.camera_x + x, g.camera_y + y)
+    else:
+        # only the tiles that came into view or went out of it since the last frame
+        for (x, y) in dirty_tiles:
+            draw_tile(x, y)
+    del dirty_tiles[:]
 
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-                wall = tile_map[x][y].block_sight
-
-                if not visible:
-                    if tile_map[x][y].explored:
-                        if wall:
-                            libtcod.console_set_char_background(con, x, y, g.color_dark_wall, libtcod.BKGND_SET)
-                        else:
-                            libtcod.console_set_char_background(con, x, y, g.color_dark_ground, libtcod.BKGND_SET)
-                else:
-                    # it's visible
-                    if wall:
-                        libtcod.console_set_char_background(con, x, y, g.color_light_wall, libtcod.BKGND_SET)
-                    else:
-                        libtcod.console_set_char_background(con, x, y, g.color_light_ground, libtcod.BKGND_SET)
-                    tile_map[x][y].explored = True
-
-    # draw all objects in the list
-    for object in objects:
-        if object != player:
-            object.draw(fov_map, tile_map, con)
-    player.draw(fov_map, tile_map, con)
+    # draw all objects, layer by layer
+    for layer in objects.layers:
+        for object in objects_in_view(layer):
+            object.draw(visible, tile_map, con)
 
     # blit the contents of con to the root console and present it
     libtcod.console_blit(con, 0, 0, g.SCREEN_WIDTH, g.SCREEN_HEIGHT, 0, 0, 0)
@@ -215,7 +550,7 @@ def from_dungeon_level(table):
 
 
 def handle_keys():
-    global fov_recompute, stairs
+    global fov_recompute, stairs, repeat_count
 
     if g.key.vk == libtcod.KEY_ENTER and g.key.lalt:
         # Alt+Enter: toggle fullscreen
@@ -227,27 +562,38 @@ def handle_keys():
     if g.game_state == 'playing':
         # movement keys
         if g.key.vk == libtcod.KEY_UP or g.key.vk == libtcod.KEY_KP8:
-            player_move_or_attack(0, -1)
+            return player_act(0, -1)
         elif g.key.vk == libtcod.KEY_DOWN or g.key.vk == libtcod.KEY_KP2:
-            player_move_or_attack(0, 1)
+            return player_act(0, 1)
         elif g.key.vk == libtcod.KEY_LEFT or g.key.vk == libtcod.KEY_KP4:
-            player_move_or_attack(-1, 0)
+            return player_act(-1, 0)
         elif g.key.vk == libtcod.KEY_RIGHT or g.key.vk == libtcod.KEY_KP6:
-            player_move_or_attack(1, 0)
+            return player_act(1, 0)
         elif g.key.vk == libtcod.KEY_HOME or g.key.vk == libtcod.KEY_KP7:
-            player_move_or_attack(-1, -1)
+            return player_act(-1, -1)
         elif g.key.vk == libtcod.KEY_PAGEUP or g.key.vk == libtcod.KEY_KP9:
-            player_move_or_attack(1, -1)
+            return player_act(1, -1)
         elif g.key.vk == libtcod.KEY_END or g.key.vk == libtcod.KEY_KP1:
-            player_move_or_attack(-1, 1)
+            return player_act(-1, 1)
         elif g.key.vk == libtcod.KEY_PAGEDOWN or g.key.vk == libtcod.KEY_KP3:
-            player_move_or_attack(1, 1)
+            return player_act(1, 1)
         elif g.key.vk == libtcod.KEY_KP5:
-            pass  # do nothing ie wait for the monster to come to you
+            return player_act(0, 0)  # do nothing ie wait for the monster to come to you
 
         else:
             key_char = chr(g.key.c)
 
+            if key_char.isdigit():
+                # a count typed before a movement or wait key repeats it that many times
+                repeat_count = min(repeat_count * 10 + int(key_char), g.REPEAT_MAX_COUNT)
+                return 'didnt-take-turn'
+
+            if g.mouse.lbutton_pressed:
+                # travel to the clicked tile
+                (x, y) = g.to_map_coordinates(g.mouse.cx, g.mouse.cy)
+                if x is not None:
+                    travel_to(x, y)
+
             if key_char == 'g':
                 # pick up an item
                 for object in objects:  # look for an item in the player's tile
@@ -268,9 +614,19 @@ def handle_keys():
                     chosen_item.drop(player, objects)
 
             if key_char == 'u':
-                # go down stairs, if the player is on them
-                if stairs.x == player.x and stairs.y == player.y:
+                # take the stairs the player is on, down or up
+                if stairs is not None and stairs.x == player.x and stairs.y == player.y:
                     next_level()
+                elif upstairs is not None and upstairs.x == player.x and upstairs.y == player.y:
+                    previous_level()
+
+            if key_char == 'r':
+                # rest until healed, or until something happens
+                rest()
+
+            if key_char == 'x':
+                # walk towards unexplored territory until something interesting happens
+                auto_explore()
 
             if key_char == 'c':
                 # show character information
@@ -286,16 +642,134 @@ def handle_keys():
             return 'didnt-take-turn'
 
 
+def store_level():
+    # put the current level in the cache, so it's still there when the player comes back
+    level_objects = layers.Layers(obj for obj in objects.everything() if obj != player)
+    level_cache.store(levels.Level(dungeon_level, tile_map, level_objects, stairs, upstairs, turn, population,
+                                   region_map))
+
+
+def restore_level(level):
+    global tile_map, objects, stairs, upstairs, population, region_map
+    tile_map = level.tile_map
+    objects = level.objects
+    objects.append(player)
+    stairs = level.stairs
+    upstairs = level.upstairs
+    population = level.population
+    region_map = level.region_map
+
+
+def catch_up_level(level):
+    # the level went on while the player was away. instead of playing every turn it missed, its monsters heal in
+    # one go, wander for a few coarse ticks and the dead get replaced, so coming back costs the same however long
+    # the player was gone, and nothing runs for levels while the player is elsewhere.
+    elapsed = turn - level.turn
+    monsters = [obj for obj in objects if obj.ai and obj != player]
+
+    # monsters kept in the column store all heal in one go
+    stored = [monster for monster in monsters if isinstance(monster, o.StoredObject)]
+    o.store.heal([monster.id for monster in stored], elapsed // g.MONSTER_REGEN_TURNS)
+    for monster in monsters:
+        if not isinstance(monster, o.StoredObject):
+            monster.fighter.heal(elapsed // g.MONSTER_REGEN_TURNS, player)
+
+    ticks = min(elapsed // g.OFFSCREEN_TICK_TURNS, g.OFFSCREEN_MAX_TICKS)
+    if ticks > 0 and monsters:
+        wander_monsters(monsters, ticks)
+
+    # new monsters show up in places the player cannot see from the stairs
+    respawns = min(elapsed // g.RESPAWN_TURNS, population - len(monsters))
+    if respawns <= 0:
+        return
+    seen = fov.shadowcast(sight_map, player.x, player.y, g.TORCH_RADIUS, g.FOV_LIGHT_WALLS)
+    (xs, ys) = np.nonzero(~walk_map & ~seen)
+    spots = open_spots(list(zip(xs.tolist(), ys.tolist())), blocking_spots())
+    for (x, y) in take_spots(spots, min(respawns, len(spots))):
+        monster = random_monster(x, y)
+        objects.append(monster)
+        g.fighters.update(monster)
+
+
+def wander_monsters(monsters, ticks):
+    # a few ticks of o.wander for all the monsters, every tick's steps resolved in one go (see movement.py). the
+    # random steps are drawn in the same order as when they wander one after the other
+    (ids, xs, ys, kinds) = monster_columns(monsters)
+    (start_xs, start_ys) = (xs.copy(), ys.copy())
+    blocking = np.array([obj.blocks for obj in monsters], dtype=bool)
+    others = [obj for obj in objects if obj.blocks and not obj.ai]
+    other_xs = np.array([obj.x for obj in others], dtype=np.int64)
+    other_ys = np.array([obj.y for obj in others], dtype=np.int64)
+    for tick in range(ticks):
+        steps = np.array([libtcod.random_get_int(0, -1, 1) for i in range(2 * len(monsters))], dtype=np.int64)
+        (dxs, dys) = (steps[0::2], steps[1::2])
+        moving = (dxs != 0) | (dys != 0)
+        static = blocking & ~moving
+        moves = movement.resolve_moves(walk_map, np.concatenate((xs[static], other_xs)),
+                                       np.concatenate((ys[static], other_ys)),
+                                       xs[moving], ys[moving], dxs[moving], dys[moving])
+        moved = np.flatnonzero(moving)[moves]
+        xs[moved] += dxs[moved]
+        ys[moved] += dys[moved]
+
+    moved = np.flatnonzero((xs != start_xs) | (ys != start_ys))
+    if ids is not None:
+        o.store.move(ids[moved], xs[moved] - start_xs[moved], ys[moved] - start_ys[moved])
+    for (i, x, y) in zip(moved.tolist(), xs[moved].tolist(), ys[moved].tolist()):
+        monster = monsters[i]
+        if ids is None:
+            (monster.x, monster.y) = (x, y)
+        g.fighters.update(monster, x, y)
+
+
 def next_level():
-    global dungeon_level
-    # advance to the next level
-    g.message('You take a moment to rest, and recover your strength.', libtcod.light_violet)
-    player.fighter.heal(player.fighter.max_hp(player) / 2, player)  # heal the player by 50%
+    global dungeon_level, upstairs
+    # advance to the next level. a new level is made for the depth it is at
+    store_level()
+    dungeon_level += 1
+    level = level_cache.take(dungeon_level)
+
+    if level is None:
+        g.message('You take a moment to rest, and recover your strength.', libtcod.light_violet)
+        player.fighter.heal(player.fighter.max_hp(player) / 2, player)  # heal the player by 50%
+
+        g.message('After a rare moment of peace, you descend deeper into the heart of the dungeon...', libtcod.red)
+        make_map()  # create a fresh new level!
+
+        # the way back up is where the player arrives
+        upstairs = o.Object(player.x, player.y, '>', 'upward stairs', libtcod.white, always_visible=True)
+        objects.append(upstairs)
+    else:
+        g.message('You descend again.', libtcod.light_violet)
+        restore_level(level)
+        (player.x, player.y) = (upstairs.x, upstairs.y)
 
-    g.message('After a rare moment of peace, you descend deeper into the heart of the dungeon...', libtcod.red)
-    make_map()  # create a fresh new level!
     initialize_fov()
-    dungeon_level += 1
+    if level is not None:
+        catch_up_level(level)
+
+
+def previous_level():
+    global dungeon_level, upstairs
+    # go back up to the level above, arriving on its stairs down
+    store_level()
+    dungeon_level -= 1
+    level = level_cache.take(dungeon_level)
+    if level is None:
+        # it's not in the cache anymore: make it again from the seed, the way it was the first time
+        make_map()
+        upstairs = None
+        if dungeon_level > 1:
+            upstairs = o.Object(player.x, player.y, '>', 'upward stairs', libtcod.white, always_visible=True)
+            objects.append(upstairs)
+    else:
+        restore_level(level)
+    (player.x, player.y) = (stairs.x, stairs.y)
+    g.message('You climb back up.', libtcod.light_violet)
+
+    initialize_fov()
+    if level is not None:
+        catch_up_level(level)
 
 
 def check_level_up():
@@ -324,10 +798,53 @@ def check_level_up():
             player.fighter.base_defense += 1
 
 
-def place_objects(room):
+def place_objects(room, occupied):
     # maximum number of monsters per room
     max_monsters = from_dungeon_level([[2, 1], [3, 4], [5, 6]])
 
+    # choose random number of monsters, as many as there's room for
+    free = free_spots(room, room.monster_spots, occupied)
+    num_monsters = min(libtcod.random_get_int(0, 0, max_monsters), len(free))
+
+    # only the monsters that get a spot are made
+    for (x, y) in take_spots(free, num_monsters, occupied):
+        objects.append(random_monster(x, y))
+    # place the items
+    place_items(room, occupied)
+
+
+def blocking_spots():
+    # the tiles blocking objects stand on. a level's generator makes this set once and hands it to place_objects,
+    # which keeps it up to date, so placing things doesn't go over all the objects for every room
+    return set((obj.x, obj.y) for obj in objects if obj.blocks)
+
+
+def free_spots(room, spots, occupied):
+    # the tiles of a room a new object could go on: the prefab's spots if the room has any, else all of the room
+    if not spots:
+        spots = [(x, y) for x in range(room.x1 + 1, room.x2) for y in range(room.y1 + 1, room.y2)]
+    return open_spots(spots, occupied)
+
+
+def open_spots(spots, occupied):
+    # the spots that are on the map, not walls and not occupied (see blocking_spots)
+    (width, height) = (len(tile_map), len(tile_map[0]))
+    return [(x, y) for (x, y) in spots
+            if 0 <= x < width and 0 <= y < height and not tile_map[x][y].blocked and (x, y) not in occupied]
+
+
+def take_spots(spots, count, occupied=None):
+    # count different spots picked at random (the list is shuffled as far as needed). the spots of blocking
+    # objects are added to occupied, if given
+    for i in range(count):
+        j = libtcod.random_get_int(0, i, len(spots) - 1)
+        (spots[i], spots[j]) = (spots[j], spots[i])
+    if occupied is not None:
+        occupied.update(spots[:count])
+    return spots[:count]
+
+
+def random_monster(x, y):
     # chance of each monster
     monster_chances = {
         'orc': 80,
@@ -337,25 +854,11 @@ def place_objects(room):
     # monster_chances = {'orc': 80, 'troll': 20}
     monster_creators = {'orc': o.create_orc, 'troll': o.create_troll}
 
-    # choose random number of monsters
-    num_monsters = libtcod.random_get_int(0, 0, max_monsters)
-
-    for i in range(num_monsters):
-        # choose random spot for this monster
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
-
-        choice = random_choice(monster_chances)
-        monster = monster_creators[choice](x, y)
-
-        # only place it if the tile is not blocked
-        if not o.is_blocked(x, y, tile_map, objects):
-            objects.append(monster)
-    # place the items
-    place_items(room)
+    choice = random_choice(monster_chances)
+    return monster_creators[choice](x, y)
 
 
-def place_items(room):
+def place_items(room, occupied):
     # maximum number of items per room
     max_items = from_dungeon_level([[1, 1], [2, 4]])
 
@@ -387,21 +890,15 @@ def place_items(room):
         'shield': None
     }
 
-    # choose random number of items
-    num_items = libtcod.random_get_int(0, 0, max_items)
+    # choose random number of items, each on a tile of its own
+    free = free_spots(room, room.item_spots, occupied)
+    num_items = min(libtcod.random_get_int(0, 0, max_items), len(free))
 
-    for i in range(num_items):
-        # choose random spot for this item
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+    for (x, y) in take_spots(free, num_items):
+        choice = random_choice(item_chances)
+        item = item_creators[choice](x, y, item_uses[choice])
 
-        # only place it if the tile is not blocked
-        if not o.is_blocked(x, y, tile_map, objects):
-            choice = random_choice(item_chances)
-            item = item_creators[choice](x, y, item_uses[choice])
-
-            objects.append(item)
-            item.send_to_back(objects)  # items appear below other objects
+        objects.append(item)
 
 
 def random_choice(chances_dict):
@@ -443,12 +940,300 @@ def player_move_or_attack(dx, dy):
             target = object
             break
 
-    # attack if target found, move otherwise
+    # attack if target found, move otherwise. returns False if the player just bumped into a wall
     if target is not None:
         player.fighter.attack(target, objects, player)
+        return True
     else:
         player.move(dx, dy, tile_map, objects)
         fov_recompute = True
+        return (player.x, player.y) == (x, y)
+
+
+def player_act(dx, dy):
+    global repeat_count
+    # move or attack in the given direction, or wait if both are 0, as many times as the typed count says
+    count = repeat_count
+    repeat_count = 0
+    if count <= 1:
+        if dx != 0 or dy != 0:
+            player_move_or_attack(dx, dy)
+        return None
+    if dx == 0 and dy == 0:
+        run_turns(lambda: True, count)
+    else:
+        run_turns(lambda: player_move_or_attack(dx, dy), count)
+    return 'didnt-take-turn'
+
+
+def visible_monsters():
+    # returns the monsters the player can currently see
+    return [obj for obj in objects
+            if obj.fighter and obj != player and visible[obj.x, obj.y]]
+
+
+def take_monster_turns():
+    # what the monsters see of the player is checked for all of them at once, then they take their turn
+    if g.MONSTER_MOVES == 'batched':
+        move_monsters()
+        return
+    watchers = [obj for obj in objects if isinstance(obj.ai, o.BasicMonster)]
+    perception.update(watchers, [obj.ai.sight_radius for obj in watchers], player)
+    if g.chase is not None:
+        g.chase.begin_turn(player.x, player.y, [(obj.x, obj.y) for obj in objects if obj.blocks])
+    for object in objects:
+        if object.ai:
+            object.ai.take_turn(perception, player, tile_map, objects)
+
+
+def objects_in_view(layer):
+    # the objects of a layer that may have to be drawn. the ones in the column store are checked against the FOV
+    # all at once, by their positions in the store, so the ones out of view are never looked at one by one
+    stored = [obj for obj in layer if isinstance(obj, o.StoredObject)]
+    if not stored:
+        return layer
+    (xs, ys) = o.store.positions([obj.id for obj in stored])
+    in_view = visible[xs, ys].tolist()
+    return ([obj for obj in layer if not isinstance(obj, o.StoredObject)] +
+            [obj for (obj, seen) in zip(stored, in_view) if seen])
+
+
+def monster_columns(monsters):
+    # the ids (None unless they're all in the column store), positions and kinds of AI of the monsters, read
+    # straight from the column store when they're kept there
+    if monsters and all(isinstance(obj, o.StoredObject) for obj in monsters):
+        ids = np.array([obj.id for obj in monsters], dtype=np.int64)
+        (xs, ys) = o.store.positions(ids)
+        return ids, xs.astype(np.int64), ys.astype(np.int64), o.store.ai_kinds(ids)
+    xs = np.array([obj.x for obj in monsters], dtype=np.int64)
+    ys = np.array([obj.y for obj in monsters], dtype=np.int64)
+    kinds = np.array([o.AI_KINDS.get(obj.ai.__class__, storage.OTHER_AI) for obj in monsters], dtype=np.int8)
+    return None, xs, ys, kinds
+
+
+def move_monsters():
+    # the monsters' turn with all of their steps resolved in one go (see movement.py), ending up where they would
+    # if they moved one after the other. chasing and confused monsters are moved, then those next to the player
+    # attack and any other AI takes its turn, in turn order.
+    monsters = []
+    others = []  # the blocking objects that aren't monsters
+    for obj in objects:
+        if obj.ai:
+            monsters.append(obj)
+        elif obj.blocks:
+            others.append(obj)
+    (ids, xs, ys, kinds) = monster_columns(monsters)
+    blocking = np.array([obj.blocks for obj in monsters], dtype=bool)
+    (other_xs, other_ys) = ([obj.x for obj in others], [obj.y for obj in others])
+    dxs = np.zeros(len(monsters), dtype=np.int64)
+    dys = np.zeros(len(monsters), dtype=np.int64)
+
+    # what BasicMonster.take_turn does: step towards the player when seen, attack when next to them
+    basic = kinds == storage.BASIC_AI
+    watchers = [monsters[i] for i in np.flatnonzero(basic).tolist()]
+    perception.update(watchers, [obj.ai.sight_radius for obj in watchers], player, xs[basic], ys[basic])
+    seeing = np.zeros(len(monsters), dtype=bool)
+    seeing[basic] = perception.seen_by(watchers)
+    far = (xs - player.x) ** 2 + (ys - player.y) ** 2 >= 4
+    chasing = seeing & far
+    if chasing.any():
+        (dxs[chasing], dys[chasing]) = movement.chase_steps(xs[chasing], ys[chasing], player.x, player.y)
+    attacking = seeing & ~far
+
+    # and what ConfusedMonster.take_turn does while confused, drawing the random steps in the same order
+    handled = basic.copy()
+    wandering = np.zeros(len(monsters), dtype=bool)
+    for i in np.flatnonzero(kinds == storage.CONFUSED_AI).tolist():
+        ai = monsters[i].ai
+        if ai.num_turns > 0:
+            dxs[i] = libtcod.random_get_int(0, -1, 1)
+            dys[i] = libtcod.random_get_int(0, -1, 1)
+            ai.num_turns -= 1
+            handled[i] = True
+            wandering[i] = True
+
+    if g.chase is None:
+        moving = (dxs != 0) | (dys != 0)
+        static = blocking & ~moving
+        steps = movement.resolve_moves(walk_map, np.concatenate((xs[static], np.array(other_xs, dtype=np.int64))),
+                                       np.concatenate((ys[static], np.array(other_ys, dtype=np.int64))),
+                                       xs[moving], ys[moving], dxs[moving], dys[moving])
+        moved = np.flatnonzero(moving)[steps]
+    else:
+        moved = chase_monsters(xs, ys, dxs, dys, blocking, chasing, wandering, other_xs, other_ys)
+    (new_xs, new_ys) = (xs[moved] + dxs[moved], ys[moved] + dys[moved])
+    if ids is not None:
+        o.store.move(ids[moved], dxs[moved], dys[moved])
+    for (i, x, y) in zip(moved.tolist(), new_xs.tolist(), new_ys.tolist()):
+        monster = monsters[i]
+        if ids is None:
+            (monster.x, monster.y) = (x, y)
+        g.fighters.update(monster, x, y)
+
+    for i in np.flatnonzero(attacking | ~handled).tolist():
+        obj = monsters[i]
+        if attacking[i]:
+            if player.fighter.hp > 0:
+                obj.fighter.attack(player, objects, player)
+        elif obj.ai:
+            obj.ai.take_turn(perception, player, tile_map, objects)
+
+
+def chase_monsters(xs, ys, dxs, dys, blocking, chasing, wandering, other_xs, other_ys):
+    # the moves of move_monsters with cooperative chasing: every chaser plans knowing where the monsters before it
+    # went, so they are planned and moved one after the other, in turn order. returns the indices of the monsters
+    # that moved.
+    g.chase.begin_turn(player.x, player.y, list(zip(xs[blocking].tolist(), ys[blocking].tolist())) +
+                       list(zip(other_xs, other_ys)))
+    moved = []
+    for i in np.flatnonzero(chasing | wandering).tolist():
+        (x, y) = (int(xs[i]), int(ys[i]))
+        if chasing[i]:
+            step = g.chase.step(x, y)
+            if step is not None:
+                (dxs[i], dys[i]) = step
+        (new_x, new_y) = (x + int(dxs[i]), y + int(dys[i]))
+        if (new_x, new_y) != (x, y) and g.chase.free(new_x, new_y):
+            if blocking[i]:
+                g.chase.moved(x, y, new_x, new_y)
+            moved.append(i)
+    return np.array(moved, dtype=np.int64)
+
+
+def end_turn():
+    global turn
+    # let monsters take their turn, and let time pass: the player slowly regenerates
+    if world is not None:
+        stream_world()
+    take_monster_turns()
+    turn += 1
+    if turn % g.REGEN_TURNS == 0 and player.fighter.hp > 0:
+        player.fighter.heal(1, player)
+
+
+def run_turns(action, max_turns, stop_colors=()):
+    # play up to max_turns turns back to back without rendering them, only the final state gets drawn.
+    # action() plays the player's part of every turn and returns False when there is nothing left to do.
+    # stops early if a monster comes into view, the player gets hurt or a message in stop_colors shows up.
+    if visible_monsters():
+        g.message('Not with enemies in view!', libtcod.red)
+        return
+
+    g.interrupt_colors = stop_colors
+    g.interrupted = False
+    for i in range(max_turns):
+        hp = player.fighter.hp
+        if not action():
+            break
+        if fov_recompute:
+            recompute_fov()
+        end_turn()
+
+        if g.game_state != 'playing' or g.interrupted:
+            break
+        if player.fighter.hp < hp:
+            g.message('You are hurt!', libtcod.red)
+            break
+        monsters = visible_monsters()
+        if monsters:
+            g.message('You spot a ' + monsters[0].name + '!', libtcod.orange)
+            break
+    g.interrupt_colors = ()
+
+
+def rest():
+    # wait until fully healed
+    if player.fighter.hp >= player.fighter.max_hp(player):
+        g.message('You are already at full health.', libtcod.light_gray)
+        return
+    run_turns(lambda: player.fighter.hp < player.fighter.max_hp(player), g.REST_MAX_TURNS, g.REST_STOP_COLORS)
+
+
+def auto_explore():
+    # keep walking towards the closest unexplored tile, without rendering the steps in between
+    def explore_step():
+        global frontier
+        if frontier is None:  # not built for this level (or chunked world window) yet
+            frontier = explore.FrontierMap(tile_map, g.MAP_WIDTH, g.MAP_HEIGHT)
+        step = frontier.next_step(player.x, player.y)
+        if step is None:
+            g.message('There is nothing left to explore.', libtcod.light_gray)
+            return False
+        return player_move_or_attack(step[0], step[1])
+
+    run_turns(explore_step, g.RUN_MAX_TURNS)
+
+
+def compute_travel_path(dest_x, dest_y, avoid_objects=False):
+    # returns the steps to the destination, or None. long trips are planned on the cluster graph, which only knows
+    # about walls; short ones, and the ones that have to get around an object, use A* (libtcod's over the FOV map,
+    # or jump point search, see PATH_ENGINE) with blocking objects treated as walls for the time being
+    global planner, jump_paths
+    if not avoid_objects and player.distance(dest_x, dest_y) >= g.HIERARCHICAL_PATH_DISTANCE:
+        if planner is None:
+            planner = pathfinding.HierarchicalMap(tile_map, len(tile_map), len(tile_map[0]), g.CLUSTER_SIZE)
+        steps = planner.path(player.x, player.y, dest_x, dest_y)
+        if steps is not None:
+            return steps
+
+    if g.PATH_ENGINE == 'jps':
+        if jump_paths is None:
+            jump_paths = pathfinding.JumpPointPath(tile_map, len(tile_map), len(tile_map[0]))
+        blockers = [obj for obj in objects if obj.blocks and obj != player and not tile_map[obj.x][obj.y].blocked]
+        for obj in blockers:
+            jump_paths.set_walkable(obj.x, obj.y, False)
+        steps = None
+        if jump_paths.compute(player.x, player.y, dest_x, dest_y):
+            steps = [jump_paths.get(i) for i in range(jump_paths.size())]
+        for obj in blockers:
+            jump_paths.set_walkable(obj.x, obj.y, True)
+        return steps
+
+    blockers = [obj for obj in objects
+                if obj.blocks and obj != player and libtcod.map_is_walkable(fov_map, obj.x, obj.y)]
+    for obj in blockers:
+        libtcod.map_set_properties(fov_map, obj.x, obj.y, not tile_map[obj.x][obj.y].block_sight, False)
+
+    path = libtcod.path_new_using_map(fov_map, pathfinding.DIAGONAL_COST)
+    steps = None
+    if libtcod.path_compute(path, player.x, player.y, dest_x, dest_y):
+        steps = [libtcod.path_get(path, i) for i in range(libtcod.path_size(path))]
+    libtcod.path_delete(path)
+
+    for obj in blockers:
+        libtcod.map_set_properties(fov_map, obj.x, obj.y, not tile_map[obj.x][obj.y].block_sight, True)
+    return steps
+
+
+def travel_to(dest_x, dest_y):
+    # walk to an explored tile over several turns. the path is computed once and only computed again if
+    # something steps into it.
+    if not tile_map[dest_x][dest_y].explored or tile_map[dest_x][dest_y].blocked:
+        return
+
+    steps = compute_travel_path(dest_x, dest_y)
+    if steps is None:
+        g.message('There is no way to get there.', libtcod.light_gray)
+        return
+
+    path_map = fov_map
+
+    def travel_step():
+        if not steps or fov_map != path_map:
+            return False  # arrived, or a chunked world moved its window and the path is stale
+        (x, y) = steps[0]
+        if o.is_blocked(x, y, tile_map, objects):
+            # something is in the way, look for a way around it
+            detour = compute_travel_path(dest_x, dest_y, avoid_objects=True)
+            if detour is None:
+                return False
+            steps[:] = detour
+            (x, y) = steps[0]
+
+        del steps[0]
+        return player_move_or_attack(x - player.x, y - player.y)
+
+    run_turns(travel_step, g.RUN_MAX_TURNS)
 
 
 def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
@@ -472,18 +1257,21 @@ def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
 
 def get_names_under_mouse():
     # return a string with the names of all objects under the mouse
-    (x, y) = (g.mouse.cx, g.mouse.cy)
+    (x, y) = g.to_map_coordinates(g.mouse.cx, g.mouse.cy)
+    if x is None:
+        return ''
 
     # create a list with the names of all objects at the mouse's coordinates and in FOV
-    names = [obj.name for obj in objects
-             if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+    names = [obj.name for obj in objects.drawn()
+             if obj.x == x and obj.y == y and visible[obj.x, obj.y]]
 
     names = ', '.join(names)  # join the names, separated by commas
     return names.capitalize()
 
 
-def main_menu():
+def main_menu(seed=None, depth=1):
     global con
+    # a seed (and depth) to start new games with can be given, to play a level found with catalogue.py
 
     con = libtcod.console_new(g.SCREEN_WIDTH, g.SCREEN_HEIGHT)
     libtcod.console_set_custom_font('arial10x10.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
@@ -509,7 +1297,7 @@ def main_menu():
         choice = menu('', ['Play a new game', 'Continue last game', 'Quit'], 24)
 
         if choice == 0:  # new game
-            new_game()
+            new_game(seed, depth)
             play_game()
         if choice == 1:  # load last game
             try:
@@ -642,26 +1430,19 @@ def cast_fireball():
     if x is None: return 'cancelled'
     g.message('The fireball explodes, burning everything within ' + str(g.FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
 
-    for obj in objects:  # damage every fighter in range, including the player
-        if obj.distance(x, y) <= g.FIREBALL_RADIUS and obj.fighter:
+    for obj in g.fighters.within(x, y, g.FIREBALL_RADIUS):  # damage every fighter in range, including the player
+        if obj.fighter:  # the ones burned before may have killed it already
             g.message('The ' + obj.name + ' gets burned for ' + str(g.FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
             obj.fighter.take_damage(g.FIREBALL_DAMAGE, objects, player)
 
 
 def closest_monster(max_range):
-    global objects, player
-    # find closest enemy, up to a maximum range, and in the player's FOV
-    closest_enemy = None
-    closest_dist = max_range + 1  # start with (slightly more than) maximum range
-
-    for object in objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
-            # calculate distance between this object and the player
-            dist = player.distance_to(object)
-            if dist < closest_dist:  # it's closer, so remember it
-                closest_enemy = object
-                closest_dist = dist
-    return closest_enemy
+    # find closest enemy, up to a maximum range, and in the player's FOV. nothing past the torch radius is visible
+    radius = max_range
+    if g.TORCH_RADIUS > 0:
+        radius = min(max_range, g.TORCH_RADIUS)
+    enemies = g.fighters.in_view(player.x, player.y, radius, visible, lambda obj: obj != player, 1)
+    return enemies[0] if enemies else None
 
 
 def target_tile(max_range=None):
@@ -673,9 +1454,9 @@ def target_tile(max_range=None):
         libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, g.key, g.mouse)
         render_all()
 
-        (x, y) = (g.mouse.cx, g.mouse.cy)
+        (x, y) = g.to_map_coordinates(g.mouse.cx, g.mouse.cy)
 
-        if (g.mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+        if (g.mouse.lbutton_pressed and x is not None and visible[x, y] and
                 (max_range is None or player.distance(x, y) <= max_range)):
             return x, y
 
@@ -691,22 +1472,39 @@ def target_monster(max_range=None):
             return None
 
         # return the first clicked monster, otherwise continue looping
-        for obj in objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in g.fighters.at(x, y):
+            if obj != player:
                 return obj
 
 
-def new_game():
-    global player, con
-
+def create_player():
     # create object representing the player
     fighter_component = o.Fighter(hp=30, defense=2, power=5, death_function=o.player_death, xp=0)
-    player = o.Object(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component)
+    player = o.Object(0, 0, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component,
+                      layer=layers.PLAYER)
     player.level = 1
+    return player
+
+
+def new_game(seed=None, depth=1):
+    global player, con, world, upstairs, level_cache, dungeon_level, turn, region_map, game_seed
+
+    player = create_player()
+    world = None
+    upstairs = None
+    region_map = None
+    level_cache = levels.LevelCache(g.LEVEL_DIRECTORY, g.LEVEL_CACHE_SIZE)
+    # a game without a given seed gets a random one, all of its levels come from it
+    game_seed = seed if seed is not None else libtcod.random_get_int(0, 0, 0x7fffffff)
+    dungeon_level = depth
+    turn = 0
 
     # generate map (at this point it's not drawn to the screen)
-    make_map()
-    initialize_fov()
+    if g.CHUNKED_WORLD:
+        new_world()
+    else:
+        make_map()
+        initialize_fov()
 
     g.game_state = 'playing'
     g.inventory = []
@@ -726,8 +1524,14 @@ def new_game():
 
 
 def initialize_fov():
-    global fov_recompute, fov_map
+    global fov_recompute, fov_map, frontier, planner, jump_paths, sight_map, visible, redraw_all, fov_origin
+    global perception, walk_map
     fov_recompute = True
+    redraw_all = True
+    fov_origin = None
+    frontier = None  # built again the first time auto-explore is used on this level
+    planner = None  # and the same for the path finders
+    jump_paths = None
     libtcod.console_clear(con)  # unexplored areas start black (which is the default background color)
 
     # create the FOV map, according to the generated map
@@ -736,39 +1540,72 @@ def initialize_fov():
         for x in range(g.MAP_WIDTH):
             libtcod.map_set_properties(fov_map, x, y, not tile_map[x][y].block_sight, not tile_map[x][y].blocked)
 
+    # and the same as arrays, for the FOV and anything else that works on the whole map at once
+    sight_map = np.array([[tile.block_sight for tile in column] for column in tile_map], dtype=bool)
+    walk_map = np.array([[tile.blocked for tile in column] for column in tile_map], dtype=bool)
+    visible = np.zeros(sight_map.shape, dtype=bool)
+    perception = fov.Perception(sight_map)
+    g.fighters = spatial.SpatialIndex(objects)
+    g.chase = None
+    if g.CHASE == 'cooperative':
+        g.chase = pathfinding.ChasePlanner(tile_map, g.MAP_WIDTH, g.MAP_HEIGHT, g.CHASE_WINDOW, g.CHASE_DISTANCE)
+
 
 def save_game():
     # open a new empty shelve (possibly overwriting an old one) to write the game data
     file = shelve.open('savegame', 'n')
-    file['map'] = tile_map
+    # a chunked world keeps its own tiles, the active window is stitched together again after loading
+    file['map'] = tile_map if world is None else None
+    file['world'] = world
     file['objects'] = objects
-    file['player_index'] = objects.index(player)
+    file['next_id'] = o.registry.next_id
+    file['player_id'] = player.id
     file['inventory'] = g.inventory
     file['game_msgs'] = g.game_msgs
     file['game_state'] = g.game_state
-    file['stairs_index'] = objects.index(stairs)
+    file['stairs_id'] = stairs.id if stairs is not None else None
+    file['upstairs_id'] = upstairs.id if upstairs is not None else None
+    file['level_cache'] = level_cache
+    file['turn'] = turn
+    file['population'] = population
+    file['region_map'] = region_map
     file['dungeon_level'] = dungeon_level
+    file['game_seed'] = game_seed
 
     file.close()
 
 
 def load_game():
     # open the previously saved shelve and load the game data
-    global tile_map, objects, player, stairs, dungeon_level
+    global tile_map, objects, player, stairs, upstairs, level_cache, dungeon_level, world, turn, population
+    global region_map, game_seed
 
     file = shelve.open('savegame', 'r')
     tile_map = file['map']
-    objects = file['objects']
-    player = objects[file['player_index']]  # get index of player in objects list and access it
+    objects = file['objects']  # loading the objects files them in the registry under their ids
+    o.registry.next_id = max(o.registry.next_id, file['next_id'])
+    player = o.registry.get(file['player_id'])
     g.inventory = file['inventory']
     g.game_msgs = file['game_msgs']
     g.game_state = file['game_state']
-    stairs = objects[file['stairs_index']]
+    stairs = o.registry.get(file['stairs_id'])
+    upstairs = o.registry.get(file['upstairs_id'])
+    level_cache = file['level_cache']
+    turn = file['turn']
+    population = file['population']
+    region_map = file['region_map']
     dungeon_level = file['dungeon_level']
+    game_seed = file['game_seed']
+    world = file['world']
 
     file.close()
 
-    initialize_fov()
+    if world is None:
+        initialize_fov()
+    else:
+        world.generate_chunk = make_chunk
+        (cx, cy) = world.center
+        enter_chunk(cx, cy, objects.everything())
 
 
 def play_game():
@@ -800,9 +1637,8 @@ def play_game():
 
         # let monsters take their turn
         if g.game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.ai:
-                    object.ai.take_turn(fov_map, player, tile_map, objects)
+            end_turn()
 
 
-main_menu()
+if __name__ == '__main__':
+    main_menu()
@@ -0,0 +1,46 @@
+from __future__ import print_function
+import timeit
+
+import libtcodpy as libtcod
+import fov
+import mapgen
+
+# times the python shadowcasting against libtcod's FOV on cave maps, at a few radii and map sizes:
+#   python bench_fov.py
+
+SIZES = [(80, 43), (200, 200), (1000, 1000)]
+RADII = [5, 10, 20, 0]  # 0 is no limit
+VIEWPOINTS = 20
+
+
+def main():
+    print('size         radius   libtcod (ms)   shadowcasting (ms)')
+    for (width, height) in SIZES:
+        blocked = mapgen.make_cave(width, height, 1)
+        floor = mapgen.floor_tiles(blocked)
+        viewpoints = floor[::max(1, len(floor) // VIEWPOINTS)][:VIEWPOINTS]
+
+        fov_map = libtcod.map_new(width, height)
+        for x in range(width):
+            for y in range(height):
+                libtcod.map_set_properties(fov_map, x, y, not blocked[x, y], not blocked[x, y])
+
+        for radius in RADII:
+            def run_libtcod():
+                for (x, y) in viewpoints:
+                    libtcod.map_compute_fov(fov_map, x, y, radius, True, 0)
+
+            def run_shadowcasting():
+                for (x, y) in viewpoints:
+                    fov.shadowcast(blocked, x, y, radius, True)
+
+            repeat = 3 if radius == 0 and width * height > 100000 else 10
+            libtcod_time = min(timeit.repeat(run_libtcod, number=1, repeat=repeat)) / len(viewpoints)
+            python_time = min(timeit.repeat(run_shadowcasting, number=1, repeat=repeat)) / len(viewpoints)
+            print('%-12s %-8s %-14.3f %.3f' % ('%dx%d' % (width, height), radius or 'none',
+                                             libtcod_time * 1000, python_time * 1000))
+        libtcod.map_delete(fov_map)
+
+
+if __name__ == '__main__':
+    main()
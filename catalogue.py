@@ -0,0 +1,136 @@
+from __future__ import print_function
+import argparse
+import multiprocessing
+import sqlite3
+from collections import deque
+
+import app
+import globals as g
+import explore
+
+# a catalogue of generated levels, to find seeds by what their levels are like:
+#   python catalogue.py build 0 10000 --depth 1 5
+#   python catalogue.py find "troll >= 3 and stairs_distance > 60" --depth 5
+#   python catalogue.py play 1234 --depth 5
+
+# objects counted on every level, each gets a column named after it
+COUNTED = ['orc', 'troll', 'healing potion', 'scroll of lightning bolt', 'scroll of fireball', 'scroll of confusion',
+           'sword', 'shield']
+
+COLUMNS = ['rooms', 'floor', 'stairs_distance', 'monsters', 'items'] + [name.replace(' ', '_') for name in COUNTED]
+
+
+def walk_distance(tile_map, start, goal):
+    # number of steps from start to goal, moving like the player does, -1 if it can't be reached
+    (width, height) = (len(tile_map), len(tile_map[0]))
+    distance = {start: 0}
+    queue = deque([start])
+    while queue:
+        (x, y) = queue.popleft()
+        if (x, y) == goal:
+            return distance[goal]
+        for (dx, dy) in explore.DIRECTIONS:
+            (nx, ny) = (x + dx, y + dy)
+            if 0 <= nx < width and 0 <= ny < height and (nx, ny) not in distance and not tile_map[nx][ny].blocked:
+                distance[(nx, ny)] = distance[(x, y)] + 1
+                queue.append((nx, ny))
+    return -1
+
+
+def describe(job):
+    # generate a level and return its row. runs in the worker processes
+    (seed, depth) = job
+    app.generate_level(seed, depth)
+
+    names = [obj.name for obj in app.objects]
+    rooms = len(app.region_map.rooms) if app.region_map is not None else 0
+    floor = sum(1 for column in app.tile_map for tile in column if not tile.blocked)
+    stairs_distance = walk_distance(app.tile_map, (app.player.x, app.player.y), (app.stairs.x, app.stairs.y))
+    monsters = sum(1 for obj in app.objects if obj.ai)
+    items = sum(1 for obj in app.objects if obj.item)
+
+    return ((seed, depth, g.MAP_GENERATOR, rooms, floor, stairs_distance, monsters, items) +
+            tuple(names.count(name) for name in COUNTED))
+
+
+def open_database(filename):
+    db = sqlite3.connect(filename)
+    db.execute('CREATE TABLE IF NOT EXISTS levels (seed INTEGER, depth INTEGER, generator TEXT, ' +
+               ', '.join(column + ' INTEGER' for column in COLUMNS) + ', PRIMARY KEY (seed, depth, generator))')
+    return db
+
+
+def build(db, seeds, depths, processes):
+    # generate every level in a pool of processes, and store the rows as they come in
+    jobs = [(seed, depth) for seed in seeds for depth in depths]
+    insert = ('INSERT OR REPLACE INTO levels VALUES (' + ', '.join(['?'] * (len(COLUMNS) + 3)) + ')')
+    pool = multiprocessing.Pool(processes)
+    rows = []
+    done = 0
+    try:
+        for row in pool.imap_unordered(describe, jobs, chunksize=16):
+            rows.append(row)
+            done += 1
+            if len(rows) >= 1000:
+                db.executemany(insert, rows)
+                db.commit()
+                rows = []
+                print(done, 'of', len(jobs), 'levels indexed')
+    finally:
+        pool.close()
+        pool.join()
+    db.executemany(insert, rows)
+    db.commit()
+
+
+def find(db, where, depth, limit):
+    # the levels made by the current generator that match an sql condition on the columns
+    query = 'SELECT seed, depth, ' + ', '.join(COLUMNS) + ' FROM levels WHERE generator = ?'
+    parameters = [g.MAP_GENERATOR]
+    if depth is not None:
+        query += ' AND depth = ?'
+        parameters.append(depth)
+    if where:
+        query += ' AND (' + where + ')'
+    query += ' LIMIT ?'
+    parameters.append(limit)
+    return db.execute(query, parameters).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index generated levels by seed, and find them again.')
+    parser.add_argument('--database', default=g.SEED_DATABASE)
+    commands = parser.add_subparsers(dest='command')
+
+    build_parser = commands.add_parser('build', help='generate and index the levels of a range of seeds')
+    build_parser.add_argument('first', type=int)
+    build_parser.add_argument('last', type=int)
+    build_parser.add_argument('--depth', type=int, nargs='+', default=[1])
+    build_parser.add_argument('--processes', type=int, default=None)
+
+    find_parser = commands.add_parser('find', help='list the levels matching a condition, e.g. "troll >= 3"')
+    find_parser.add_argument('where', nargs='?', default='')
+    find_parser.add_argument('--depth', type=int, default=None)
+    find_parser.add_argument('--limit', type=int, default=20)
+
+    play_parser = commands.add_parser('play', help='start the game with a seed')
+    play_parser.add_argument('seed', type=int)
+    play_parser.add_argument('--depth', type=int, default=1)
+
+    args = parser.parse_args()
+    if args.command == 'play':
+        app.main_menu(args.seed, args.depth)
+        return
+
+    db = open_database(args.database)
+    if args.command == 'build':
+        build(db, range(args.first, args.last), args.depth, args.processes)
+    else:
+        print('\t'.join(['seed', 'depth'] + COLUMNS))
+        for row in find(db, args.where, args.depth, args.limit):
+            print('\t'.join(str(value) for value in row))
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
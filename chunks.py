@@ -0,0 +1,145 @@
+import os
+import pickle
+from collections import OrderedDict
+
+
+class Chunk:
+    # a square piece of a chunked world, with its own tiles and objects
+    def __init__(self, cx, cy, tiles, objects):
+        self.cx = cx
+        self.cy = cy
+        self.tiles = tiles  # columns of tiles, indexed like tile_map
+        self.objects = objects  # the objects standing on this chunk, in world coordinates
+
+
+class ChunkedWorld:
+    # a world too big to keep in memory at once. only a window of chunks around the player is active, and the game
+    # sees it as a regular tile_map and objects list. chunks are generated the first time they come within range,
+    # and once more than max_loaded are in memory the least recently used ones are written to disk and dropped.
+    def __init__(self, width, height, chunk_size, generate_chunk, directory, radius, max_loaded):
+        self.width = width  # in chunks
+        self.height = height
+        self.chunk_size = chunk_size
+        self.generate_chunk = generate_chunk
+        self.directory = directory
+        self.radius = radius
+        # the active window always has to fit in memory
+        self.max_loaded = max(max_loaded, (2 * radius + 1) ** 2)
+
+        self.loaded = OrderedDict()  # (cx, cy) -> Chunk, least recently used first
+        self.generated = set()  # the (cx, cy) of every chunk made so far, in memory or on disk
+        self.window = []
+        self.center = None
+        self.origin_x = 0  # world coordinates of the window's top-left tile
+        self.origin_y = 0
+        self.window_width = 0
+        self.window_height = 0
+
+        # chunks left over from an older world would be mistaken for already generated ones
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in os.listdir(directory):
+            if name.endswith('.chunk'):
+                os.remove(os.path.join(directory, name))
+
+    def __getstate__(self):
+        # the generator is a function of the game, it is handed back after loading. the chunks on disk are part of
+        # the save: the directory is cleared by a new world and keeps changing as the game goes on after saving
+        state = self.__dict__.copy()
+        state['generate_chunk'] = None
+        state['evicted'] = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.chunk'):
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    state['evicted'][name] = f.read()
+        return state
+
+    def __setstate__(self, state):
+        # the chunks of the saved game replace whatever is in the directory
+        evicted = state.pop('evicted')
+        self.__dict__.update(state)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for name in os.listdir(self.directory):
+            if name.endswith('.chunk'):
+                os.remove(os.path.join(self.directory, name))
+        for (name, data) in evicted.items():
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(data)
+
+    def chunk_path(self, cx, cy):
+        return os.path.join(self.directory, '%d_%d.chunk' % (cx, cy))
+
+    def chunk_at(self, x, y):
+        # the chunk that world coordinates x, y are in
+        return x // self.chunk_size, y // self.chunk_size
+
+    def get_chunk(self, cx, cy):
+        # returns a chunk, from memory if possible, then from disk, and generating it the first time it's needed
+        key = (cx, cy)
+        chunk = self.loaded.pop(key, None)
+        if chunk is None:
+            path = self.chunk_path(cx, cy)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    (tiles, objects) = pickle.load(f)
+                chunk = Chunk(cx, cy, tiles, objects)
+            elif key in self.generated:
+                # making it again would bring back what was taken from it, and lose what was left on it
+                raise IOError('Chunk ' + str(key) + ' was generated but is missing from ' + self.directory + '.')
+            else:
+                chunk = self.generate_chunk(cx, cy)
+                self.generated.add(key)
+        self.loaded[key] = chunk  # now the most recently used
+        return chunk
+
+    def evict(self):
+        # write the least recently used chunks outside the window to disk, until few enough are left in memory
+        for key in list(self.loaded.keys()):
+            if len(self.loaded) <= self.max_loaded:
+                break
+            if key in self.window:
+                continue
+            chunk = self.loaded.pop(key)
+            with open(self.chunk_path(chunk.cx, chunk.cy), 'wb') as f:
+                pickle.dump((chunk.tiles, chunk.objects), f, pickle.HIGHEST_PROTOCOL)
+
+    def activate(self, center_cx, center_cy, objects):
+        # make the chunks within radius of the center chunk the active window. the objects of the old window (in
+        # its coordinates) go back to the chunks they stand on; returns the tile_map and the objects of the new
+        # window, in the new window's coordinates.
+        for obj in objects:
+            obj.x += self.origin_x
+            obj.y += self.origin_y
+            self.loaded[self.chunk_at(obj.x, obj.y)].objects.append(obj)
+
+        cxs = range(max(0, center_cx - self.radius), min(self.width, center_cx + self.radius + 1))
+        cys = range(max(0, center_cy - self.radius), min(self.height, center_cy + self.radius + 1))
+        self.window = [(cx, cy) for cx in cxs for cy in cys]
+        self.center = (center_cx, center_cy)
+        self.origin_x = cxs[0] * self.chunk_size
+        self.origin_y = cys[0] * self.chunk_size
+        self.window_width = len(cxs) * self.chunk_size
+        self.window_height = len(cys) * self.chunk_size
+
+        # while they're in the window, the chunks' objects live in the active list
+        active = []
+        for (cx, cy) in self.window:
+            chunk = self.get_chunk(cx, cy)
+            for obj in chunk.objects:
+                obj.x -= self.origin_x
+                obj.y -= self.origin_y
+                active.append(obj)
+            chunk.objects = []
+
+        # stitch the chunks' columns together into one map
+        tile_map = []
+        for cx in cxs:
+            for x in range(self.chunk_size):
+                column = []
+                for cy in cys:
+                    column.extend(self.loaded[(cx, cy)].tiles[x])
+                tile_map.append(column)
+
+        self.evict()
+        return tile_map, active
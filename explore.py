@@ -0,0 +1,124 @@
+import heapq
+
+# the 8 directions the movement keys allow
+DIRECTIONS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+UNREACHABLE = 1 << 30
+
+
+class FrontierMap:
+    # distance from every walkable tile to the closest walkable tile that is not explored yet.
+    # it's built once per level and then patched as tiles get explored, instead of being rebuilt every step.
+    def __init__(self, tile_map, width, height):
+        self.width = width
+        self.height = height
+        size = width * height
+
+        self.walkable = [False] * size
+        self.goal = [False] * size
+        for x in range(width):
+            for y in range(height):
+                tile = tile_map[x][y]
+                if not tile.blocked:
+                    i = x + y * width
+                    self.walkable[i] = True
+                    self.goal[i] = not tile.explored
+
+        self.dist = [UNREACHABLE] * size
+        queue = []
+        for i in range(size):
+            if self.goal[i]:
+                self.dist[i] = 0
+                queue.append(i)
+
+        # plain breadth first search from all the unexplored tiles at once
+        for i in queue:
+            d = self.dist[i] + 1
+            for n in self.neighbours(i):
+                if self.dist[n] > d:
+                    self.dist[n] = d
+                    queue.append(n)
+
+    def neighbours(self, i):
+        # walkable tiles next to tile i
+        x = i % self.width
+        y = i // self.width
+        for (dx, dy) in DIRECTIONS:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height:
+                n = nx + ny * self.width
+                if self.walkable[n]:
+                    yield n
+
+    def distance(self, x, y):
+        return self.dist[x + y * self.width]
+
+    def explore(self, cells):
+        # the given (x, y) tiles were just explored, so they stop being goals. only the tiles whose
+        # shortest route led to one of them are touched.
+        removed = []
+        for (x, y) in cells:
+            i = x + y * self.width
+            if self.goal[i]:
+                self.goal[i] = False
+                removed.append(i)
+        if not removed:
+            return
+
+        # find every tile that has no shortest route left, going outwards one distance at a time
+        dist = self.dist
+        affected = set(removed)
+        level = removed
+        while level:
+            next_level = []
+            for i in level:
+                d = dist[i] + 1
+                for n in self.neighbours(i):
+                    if dist[n] != d or n in affected:
+                        continue
+                    # it keeps its distance if any other parent one step closer survives
+                    if not any(dist[m] == d - 1 and m not in affected for m in self.neighbours(n)):
+                        affected.add(n)
+                        next_level.append(n)
+            level = next_level
+
+        # reset the affected tiles, and seed them from their unaffected neighbours
+        for i in affected:
+            dist[i] = UNREACHABLE
+        heap = []
+        for i in affected:
+            best = UNREACHABLE
+            for n in self.neighbours(i):
+                if n not in affected and dist[n] + 1 < best:
+                    best = dist[n] + 1
+            if best < UNREACHABLE:
+                dist[i] = best
+                heap.append((best, i))
+        heapq.heapify(heap)
+
+        # and let the distances flow back in, only through the affected tiles
+        while heap:
+            (d, i) = heapq.heappop(heap)
+            if d > dist[i]:
+                continue
+            for n in self.neighbours(i):
+                if n in affected and dist[n] > d + 1:
+                    dist[n] = d + 1
+                    heapq.heappush(heap, (d + 1, n))
+
+    def next_step(self, x, y):
+        # returns the (dx, dy) step that gets closer to unexplored territory, or None if there's none left
+        best = self.dist[x + y * self.width]
+        if best >= UNREACHABLE:
+            return None
+        step = None
+        for (dx, dy) in DIRECTIONS:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height:
+                d = self.dist[nx + ny * self.width]
+                if d < best:
+                    best = d
+                    step = (dx, dy)
+        return step
@@ -0,0 +1,162 @@
+import numpy as np
+
+# the four quadrants around the viewer: a (depth, column) in a quadrant is at x + dx, y + dy with
+# dx = depth * depth_x + column * column_x and dy = depth * depth_y + column * column_y
+QUADRANTS = [(0, -1, 1, 0), (0, 1, 1, 0), (1, 0, 0, 1), (-1, 0, 0, 1)]
+
+
+def shadowcast(block_sight, x, y, radius, light_walls):
+    # symmetric shadowcasting (if a tile can see another, the other can see it back): returns a bool array shaped
+    # like block_sight with True on every tile seen from x, y. a radius of 0 means no limit, like libtcod.
+    # slopes are kept as (numerator, denominator) integers so no floats get to round the edges of shadows.
+    (width, height) = block_sight.shape
+    visible = np.zeros((width, height), dtype=bool)
+    visible[x, y] = True
+    max_depth = radius if radius > 0 else max(width, height)
+    radius_squared = radius * radius
+    # only the part of the map within reach is looked at
+    (left, top) = (max(0, x - max_depth), max(0, y - max_depth))
+    opaque = block_sight[left:x + max_depth + 1, top:y + max_depth + 1].tolist()
+
+    for (depth_x, depth_y, column_x, column_y) in QUADRANTS:
+        def tile(depth, column):
+            # map coordinates of a tile of the quadrant, or None off the map
+            tx = x + depth * depth_x + column * column_x
+            ty = y + depth * depth_y + column * column_y
+            if 0 <= tx < width and 0 <= ty < height:
+                return tx, ty
+            return None
+
+        # rows still to scan: (depth, start slope, end slope)
+        rows = [(1, (-1, 1), (1, 1))]
+        while rows:
+            (depth, start, end) = rows.pop()
+            if depth > max_depth:
+                continue
+            # the columns between the slopes, rounding ties towards the middle of the row
+            first = (2 * depth * start[0] + start[1]) // (2 * start[1])
+            last = -((end[1] - 2 * depth * end[0]) // (2 * end[1]))
+            previous = None  # whether the previous tile of the row was a wall, None before the first one
+            for column in range(first, last + 1):
+                position = tile(depth, column)
+                wall = position is None or opaque[position[0] - left][position[1] - top]
+
+                # floor is only seen when its middle is inside the slopes, that's what makes it symmetric
+                if position is not None and (radius <= 0 or depth * depth + column * column <= radius_squared):
+                    if wall:
+                        if light_walls:
+                            visible[position] = True
+                    elif column * start[1] >= depth * start[0] and column * end[1] <= depth * end[0]:
+                        visible[position] = True
+
+                if previous and not wall:
+                    start = (2 * column - 1, 2 * depth)
+                if previous is False and wall:
+                    rows.append((depth + 1, start, (2 * column - 1, 2 * depth)))
+                previous = wall
+            if previous is False:
+                rows.append((depth + 1, start, end))
+    return visible
+
+
+def changed(old, new, area=None):
+    # the (x, y) of every tile that came into view or went out of it between two FOV results. area, as
+    # (x1, y1, x2, y2) with the ends excluded, limits the comparison to where they can differ
+    (x1, y1) = (0, 0)
+    (x2, y2) = old.shape
+    if area is not None:
+        (x1, y1) = (max(x1, area[0]), max(y1, area[1]))
+        (x2, y2) = (min(x2, area[2]), min(y2, area[3]))
+    (xs, ys) = np.nonzero(old[x1:x2, y1:y2] != new[x1:x2, y1:y2])
+    return list(zip((xs + x1).tolist(), (ys + y1).tolist()))
+
+
+def lines_of_sight(block_sight, xs, ys, x, y):
+    # whether each of the points xs, ys has a clear line to x, y, with no tile that blocks sight in between (the
+    # ends are not looked at). all the lines are walked at once, one step of every line per column of the arrays.
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    dx = (x - xs)[:, None]
+    dy = (y - ys)[:, None]
+    steps = np.maximum(np.abs(dx), np.abs(dy))
+    longest = int(steps.max()) if len(xs) else 0
+    if longest < 2:
+        return np.ones(len(xs), dtype=bool)
+
+    # the points of every line, rounded to the nearest tile; past its end a line stays on its start
+    t = np.arange(1, longest)[None, :]
+    inside = t < steps
+    divisor = 2 * np.maximum(steps, 1)
+    line_xs = np.where(inside, xs[:, None] + (2 * dx * t + divisor // 2) // divisor, xs[:, None])
+    line_ys = np.where(inside, ys[:, None] + (2 * dy * t + divisor // 2) // divisor, ys[:, None])
+    return ~(block_sight[line_xs, line_ys] & inside).any(axis=1)
+
+
+# the answer of a monster that has none yet, out of date for any position
+NO_ANSWER = ((-1, -1, -1, -1, -1), False)
+
+
+class Perception:
+    # what each monster can see of a target: it has to be within the monster's sight radius, with a clear line
+    # between them. the lines of all the monsters that need one are checked in one batch, and every answer is
+    # kept until the monster or the target moves (a new map gets a new Perception). answers are kept by the
+    # monster's id, so a monster isn't kept alive by them, and the ones that stop watching are forgotten.
+    def __init__(self, block_sight):
+        self.block_sight = block_sight
+        self.seen = {}  # monster id -> ((monster x, monster y, target x, target y, radius), seen)
+
+    def update(self, monsters, radii, target, xs=None, ys=None):
+        # work out, in one go, the answers for all the monsters watching the target this turn. the ones that
+        # aren't among them anymore (dead, or busy with something else) are forgotten. when the monsters'
+        # positions are given as arrays, the answers that are out of date are found by comparing whole arrays
+        # rather than one monster at a time
+        if xs is None:
+            watching = set(monster.id for monster in monsters)
+            for id in [id for id in self.seen if id not in watching]:
+                del self.seen[id]
+            self.refresh(monsters, radii, target)
+            return
+
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        radii = np.asarray(list(radii), dtype=np.int64)
+        ids = [monster.id for monster in monsters]
+        keys = np.stack((xs, ys, np.full(len(xs), target.x), np.full(len(xs), target.y), radii), axis=1)
+        answers = [self.seen.get(id, NO_ANSWER) for id in ids]
+        old_keys = np.array([key for (key, sees) in answers], dtype=np.int64).reshape(-1, 5)
+        seen = np.array([sees for (key, sees) in answers], dtype=bool)
+        stale = (old_keys != keys).any(axis=1)
+        if stale.any():
+            seen[stale] = self.check(xs[stale], ys[stale], radii[stale], target)
+        self.seen = dict(zip(ids, zip([tuple(key) for key in keys.tolist()], seen.tolist())))
+
+    def refresh(self, monsters, radii, target):
+        # work out the answers that are missing or out of date for these monsters
+        stale = []
+        for (monster, radius) in zip(monsters, radii):
+            key = (monster.x, monster.y, target.x, target.y, radius)
+            answer = self.seen.get(monster.id)
+            if answer is None or answer[0] != key:
+                stale.append((monster.id, key))
+        if not stale:
+            return
+
+        keys = np.array([key for (id, key) in stale], dtype=np.int64)
+        seen = self.check(keys[:, 0], keys[:, 1], keys[:, 4], target)
+        for ((id, key), sees) in zip(stale, seen.tolist()):
+            self.seen[id] = (key, sees)
+
+    def check(self, xs, ys, radii, target):
+        # whether monsters at xs, ys with these sight radii see the target
+        seen = (xs - target.x) ** 2 + (ys - target.y) ** 2 <= radii ** 2
+        if seen.any():
+            seen[seen] = lines_of_sight(self.block_sight, xs[seen], ys[seen], target.x, target.y)
+        return seen
+
+    def seen_by(self, monsters):
+        # whether each of these monsters sees the target, as of the last update
+        return np.array([self.seen[monster.id][1] for monster in monsters], dtype=bool)
+
+    def sees(self, monster, target, radius):
+        self.refresh([monster], [radius], target)
+        return self.seen[monster.id][1]
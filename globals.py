@@ -22,20 +22,99 @@ LIMIT_FPS = 15
 MAP_WIDTH = 80
 MAP_HEIGHT = 43
 
+# the part of the map that is shown on screen. the map itself can be much larger, the camera follows the player
+CAMERA_WIDTH = SCREEN_WIDTH
+CAMERA_HEIGHT = PANEL_Y
+
+# 'rooms', 'bsp' or 'caves'
+MAP_GENERATOR = 'rooms'
+
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
 MAX_ROOMS = 30
 
+# the bsp generator splits the map this many times at most, and never into leaves smaller than a room with its walls
+BSP_DEPTH = 8
+BSP_MIN_LEAF_SIZE = ROOM_MAX_SIZE + 1
+
+# chance (in %) that a room gets one of the prefabs in PREFAB_DIRECTORY that fit inside it
+PREFAB_CHANCE = 30
+PREFAB_DIRECTORY = 'prefabs'
+
+# caves get as many monsters and items as rooms would, one room's worth for every this many floor tiles
+CAVE_TILES_PER_AREA = 80
+
+# levels the player left are kept, the LEVEL_CACHE_SIZE most recently visited in memory and the rest in LEVEL_DIRECTORY
+LEVEL_CACHE_SIZE = 3
+LEVEL_DIRECTORY = 'levels'
+
+# where catalogue.py keeps its index of levels by seed
+SEED_DATABASE = 'seeds.db'
+
+# levels the player is away from are caught up when they come back: monsters heal 1 HP every MONSTER_REGEN_TURNS,
+# wander a step every OFFSCREEN_TICK_TURNS (at most OFFSCREEN_MAX_TICKS steps) and one respawns every RESPAWN_TURNS
+MONSTER_REGEN_TURNS = 20
+OFFSCREEN_TICK_TURNS = 10
+OFFSCREEN_MAX_TICKS = 20
+RESPAWN_TURNS = 200
+
+# a chunked world is one endless level of WORLD_WIDTH x WORLD_HEIGHT chunks. only the chunks within CHUNK_RADIUS of
+# the player's are active, and at most MAX_LOADED_CHUNKS are kept in memory, the rest are saved in CHUNK_DIRECTORY
+CHUNKED_WORLD = False
+WORLD_WIDTH = 64
+WORLD_HEIGHT = 64
+CHUNK_SIZE = 32
+CHUNK_MAX_ROOMS = 4
+CHUNK_RADIUS = 2
+MAX_LOADED_CHUNKS = 64
+CHUNK_DIRECTORY = 'world'
+
 color_dark_wall = libtcod.Color(50, 50, 50)
 color_dark_ground = libtcod.Color(100, 100, 100)
 color_light_wall = libtcod.Color(70, 70, 70)
 color_light_ground = libtcod.Color(120, 120, 120)
 #############################################
 
+FOV_ENGINE = 'libtcod'  # or 'shadowcasting', done in python on the map's block_sight array (see fov.py)
 FOV_ALGO = 0  # default FOV algorithm
 FOV_LIGHT_WALLS = True
 TORCH_RADIUS = 10
 
+# 'objects' keeps every monster's data in its own python objects, 'columns' in numpy arrays indexed by entity id
+# (see storage.py), for levels with thousands of monsters
+ENTITY_STORAGE = 'objects'
+
+# 'sequential' lets the monsters move one after the other, 'batched' works out all of their moves at once with the
+# same outcome (see movement.py), which is much faster with lots of them
+MONSTER_MOVES = 'sequential'
+
+# how far monsters see the player, when nothing is in the way
+MONSTER_SIGHT_RADIUS = 10
+TROLL_SIGHT_RADIUS = 7
+
+# 'direct' monsters head straight for the player, 'cooperative' ones follow the walking distance to them and book
+# their tiles CHASE_WINDOW turns ahead so they don't get in each other's way (see pathfinding.py). the distances
+# only go as far as CHASE_DISTANCE steps, monsters farther away head straight for the player
+CHASE = 'direct'
+CHASE_WINDOW = 4
+CHASE_DISTANCE = 30
+
+# auto-explore and travel give up after this many turns without being interrupted
+RUN_MAX_TURNS = 1000
+
+# trips at least this far are planned over clusters of CLUSTER_SIZE x CLUSTER_SIZE tiles (see pathfinding.py)
+HIERARCHICAL_PATH_DISTANCE = 30
+CLUSTER_SIZE = 10
+
+# the A* used for the rest: 'libtcod', or 'jps' for jump point search in python (see pathfinding.py)
+PATH_ENGINE = 'libtcod'
+
+# the player regenerates 1 HP every this many turns
+REGEN_TURNS = 10
+REST_MAX_TURNS = 1000
+REST_STOP_COLORS = (libtcod.red, libtcod.orange)
+REPEAT_MAX_COUNT = 1000
+
 #############################################
 player_x = 25
 player_y = 23
@@ -63,10 +142,27 @@ key = libtcod.Key()
 
 inventory = []
 
+# top-left corner of the camera, in map coordinates
+camera_x = 0
+camera_y = 0
+
+# messages in one of these colors interrupt commands that play several turns in a row
+interrupt_colors = ()
+interrupted = False
+
+# the current level's fighters by position (a spatial.SpatialIndex), for the queries around a tile
+fighters = None
+
+# the monsters chasing the player on the current level, a pathfinding.ChasePlanner when CHASE is 'cooperative'
+chase = None
+
 
 def message(new_msg, color=libtcod.white):
     # split the message if necessary, among multiple lines
+    global interrupted
     new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
+    if color in interrupt_colors:
+        interrupted = True
 
     for line in new_msg_lines:
         # if the buffer is full, remove the first line to make room for the new one
@@ -75,3 +171,21 @@ def message(new_msg, color=libtcod.white):
 
         # add the new line as a tuple, with the text and the color
         game_msgs.append((line, color))
+
+
+def to_camera_coordinates(x, y):
+    # convert map coordinates to a position on screen, or (None, None) if it's outside the camera's view
+    (x, y) = (x - camera_x, y - camera_y)
+    if x < 0 or y < 0 or x >= CAMERA_WIDTH or y >= CAMERA_HEIGHT:
+        return None, None
+    return x, y
+
+
+def to_map_coordinates(x, y):
+    # convert a position on screen (eg. the mouse's) to map coordinates, or (None, None) if there's no map there
+    if x < 0 or y < 0 or x >= CAMERA_WIDTH or y >= CAMERA_HEIGHT:
+        return None, None
+    (x, y) = (x + camera_x, y + camera_y)
+    if x >= MAP_WIDTH or y >= MAP_HEIGHT:
+        return None, None
+    return x, y
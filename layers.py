@@ -0,0 +1,43 @@
+import itertools
+
+# the layers objects are drawn in, bottom first. every Object knows the layer it belongs to (see Object.layer)
+FEATURES = 0  # stairs and the like
+CORPSES = 1
+ITEMS = 2
+ACTORS = 3
+PLAYER = 4
+LAYER_COUNT = 5
+
+# the layers the game plays with. corpses are only ever drawn, so the AI, blocking and targeting loops never meet them
+GAMEPLAY = [FEATURES, ITEMS, ACTORS, PLAYER]
+
+
+class Layers:
+    # the objects of a level, one list per layer. iterating goes over the gameplay layers only, drawn() goes over
+    # every layer in drawing order, so nothing has to be moved around in a list to show up below the others.
+    def __init__(self, objects=()):
+        self.layers = [[] for layer in range(LAYER_COUNT)]
+        for obj in objects:
+            self.append(obj)
+
+    def append(self, obj):
+        self.layers[obj.layer].append(obj)
+
+    def remove(self, obj):
+        self.layers[obj.layer].remove(obj)
+
+    def move(self, obj, layer):
+        # put an object in another layer, e.g. a monster that died
+        self.remove(obj)
+        obj.layer = layer
+        self.append(obj)
+
+    def __iter__(self):
+        return itertools.chain(*[self.layers[layer] for layer in GAMEPLAY])
+
+    def drawn(self):
+        return itertools.chain(*self.layers)
+
+    def everything(self):
+        # all the objects, corpses too, as a list
+        return list(self.drawn())
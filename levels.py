@@ -0,0 +1,131 @@
+import os
+import pickle
+import zlib
+from collections import OrderedDict
+
+# a tile is packed into one byte with these flags
+BLOCKED = 1
+BLOCK_SIGHT = 2
+EXPLORED = 4
+
+
+def pack_tiles(tile_map):
+    # one byte per tile, column after column, compressed
+    data = bytearray(len(tile_map) * len(tile_map[0]))
+    i = 0
+    for column in tile_map:
+        for tile in column:
+            data[i] = ((BLOCKED if tile.blocked else 0) | (BLOCK_SIGHT if tile.block_sight else 0) |
+                       (EXPLORED if tile.explored else 0))
+            i += 1
+    return zlib.compress(bytes(data))
+
+
+def unpack_tiles(packed, width, height, tile_class):
+    data = bytearray(zlib.decompress(packed))
+    tile_map = []
+    for x in range(width):
+        column = []
+        for y in range(height):
+            flags = data[x * height + y]
+            tile = tile_class(bool(flags & BLOCKED), bool(flags & BLOCK_SIGHT))
+            tile.explored = bool(flags & EXPLORED)
+            column.append(tile)
+        tile_map.append(column)
+    return tile_map
+
+
+class Level:
+    # a dungeon level the player is not on: its map, and all of its objects except the player
+    def __init__(self, depth, tile_map, objects, stairs, upstairs, turn, population, region_map):
+        self.depth = depth
+        self.tile_map = tile_map
+        self.objects = objects
+        self.stairs = stairs
+        self.upstairs = upstairs
+        self.turn = turn  # when the player left, to catch up on the time spent away
+        self.population = population  # how many monsters it started with
+        self.region_map = region_map
+
+    def __getstate__(self):
+        # pickled with one byte per tile instead of a Tile object each
+        state = self.__dict__.copy()
+        state['tile_map'] = pack_tiles(self.tile_map)
+        state['map_size'] = (len(self.tile_map), len(self.tile_map[0]))
+        state['tile_class'] = self.tile_map[0][0].__class__
+        return state
+
+    def __setstate__(self, state):
+        (width, height) = state.pop('map_size')
+        tile_class = state.pop('tile_class')
+        state['tile_map'] = unpack_tiles(state['tile_map'], width, height, tile_class)
+        self.__dict__.update(state)
+
+
+class LevelCache:
+    # the levels the player has left, by depth. the most recently used ones stay in memory, and once there are
+    # more than max_loaded the others are written to disk.
+    def __init__(self, directory, max_loaded):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()  # depth -> Level, least recently used first
+
+        # levels left over from an older game must not turn up in this one
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in os.listdir(directory):
+            if name.endswith('.level'):
+                os.remove(os.path.join(directory, name))
+
+    def level_path(self, depth):
+        return os.path.join(self.directory, 'depth_%d.level' % depth)
+
+    def __getstate__(self):
+        # a save has to hold the levels on disk as well: the files go as soon as they're read, and a new game
+        # clears the directory, so they wouldn't be there anymore when the save is loaded
+        state = self.__dict__.copy()
+        state['evicted'] = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.level'):
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    state['evicted'][name] = f.read()
+        return state
+
+    def __setstate__(self, state):
+        # the files of the saved game replace whatever is in the directory
+        evicted = state.pop('evicted')
+        self.__dict__.update(state)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for name in os.listdir(self.directory):
+            if name.endswith('.level'):
+                os.remove(os.path.join(self.directory, name))
+        for (name, data) in evicted.items():
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(data)
+
+    def store(self, level):
+        # keep a level the player just left
+        self.loaded.pop(level.depth, None)
+        self.loaded[level.depth] = level
+        self.evict()
+
+    def take(self, depth):
+        # returns the level at the given depth (it's the player's again, so it's not kept here anymore),
+        # or None if it was never visited
+        level = self.loaded.pop(depth, None)
+        if level is None:
+            path = self.level_path(depth)
+            if not os.path.exists(path):
+                return None
+            with open(path, 'rb') as f:
+                level = pickle.loads(zlib.decompress(f.read()))
+            os.remove(path)
+        return level
+
+    def evict(self):
+        # write the least recently used levels to disk
+        while len(self.loaded) > self.max_loaded:
+            (depth, level) = self.loaded.popitem(last=False)
+            with open(self.level_path(depth), 'wb') as f:
+                f.write(zlib.compress(pickle.dumps(level, pickle.HIGHEST_PROTOCOL)))
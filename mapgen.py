@@ -0,0 +1,251 @@
+import numpy as np
+
+# maps are (width, height) arrays, indexed [x, y] like tile_map
+
+
+def neighbour_count(walls):
+    # number of walls in the 3x3 block around every tile (itself included), the outside of the map counts as wall
+    (width, height) = walls.shape
+    padded = np.ones((width + 2, height + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = walls
+    count = np.zeros((width, height), dtype=np.uint8)
+    for dx in range(3):
+        for dy in range(3):
+            count += padded[dx:dx + width, dy:dy + height]
+    return count
+
+
+def label_regions(floor):
+    # number the 8-connected regions of floor tiles: returns an int array with -1 on walls, and the number of
+    # regions. every tile points to a parent, regions are merged by hooking roots to the smallest neighbouring root
+    # and then jumping pointers, so it takes a handful of whole-map passes instead of a flood fill per region.
+    (width, height) = floor.shape
+    size = width * height
+    cells = np.flatnonzero(floor.ravel()).astype(np.int32)
+    parent = np.full(size + 1, size, dtype=np.int32)  # walls point to the extra last entry
+    parent[cells] = cells
+
+    padded = np.full((width + 2, height + 2), size, dtype=np.int32)
+    inner = padded[1:-1, 1:-1]
+    while True:
+        # the smallest root in the 3x3 block around every floor tile
+        inner[...] = parent[:size].reshape(width, height)
+        lowest = inner.copy()
+        for dx in range(3):
+            for dy in range(3):
+                np.minimum(lowest, padded[dx:dx + width, dy:dy + height], out=lowest)
+        lowest = lowest.ravel()[cells]
+
+        roots = parent[cells]
+        changed = lowest < roots
+        if not changed.any():
+            break  # every tile has the same root as all of its neighbours
+        np.minimum.at(parent, roots[changed], lowest[changed])
+        parent[cells] = np.minimum(parent[cells], lowest)
+
+        # point every tile straight at its root
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+    roots = parent[cells]
+    is_root = np.zeros(size + 1, dtype=bool)
+    is_root[roots] = True
+    labels = np.full(size, -1, dtype=np.int32)
+    labels[cells] = (np.cumsum(is_root) - 1)[roots]
+    return labels.reshape(width, height), int(is_root.sum())
+
+
+def carve_line(blocked, x1, y1, x2, y2):
+    # an L-shaped tunnel, horizontal first
+    blocked[min(x1, x2):max(x1, x2) + 1, y1] = False
+    blocked[x2, min(y1, y2):max(y1, y2) + 1] = False
+
+
+def join_regions(blocked, labels, count, rng, min_size):
+    # fill in regions too small to matter, then dig a tunnel from every other region to the closest tile of the
+    # biggest one (measured against a sample of its tiles, to keep it cheap on huge maps)
+    flat = labels.ravel()
+    cells = np.flatnonzero(flat >= 0)
+    sizes = np.bincount(flat[cells], minlength=count)
+    small = sizes[flat[cells]] < min_size
+    blocked.flat[cells[small]] = True
+
+    # the tiles of every region, one after the other
+    order = cells[np.argsort(flat[cells], kind='stable')]
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    main = np.argmax(sizes)
+
+    main_cells = order[starts[main]:starts[main + 1]]
+    if len(main_cells) > 4096:
+        main_cells = rng.choice(main_cells, 4096, replace=False)
+    (main_xs, main_ys) = np.unravel_index(main_cells, labels.shape)
+
+    for region in np.flatnonzero(sizes >= min_size):
+        if region == main:
+            continue
+        cell = order[starts[region] + rng.randint(sizes[region])]
+        (x, y) = np.unravel_index(cell, labels.shape)
+        closest = np.argmin(np.maximum(np.abs(main_xs - x), np.abs(main_ys - y)))
+        carve_line(blocked, x, y, main_xs[closest], main_ys[closest])
+
+
+class DisjointSet:
+    # union-find with path halving and union by size
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            (a, b) = (b, a)
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+
+def floor_components(blocked):
+    # the 8-connected pieces of floor: returns an int array with a component number on every floor tile and -1 on
+    # walls, and the number of components. the union-find works on runs of floor down each column rather than on
+    # single tiles, so it only has to merge the runs of neighbouring columns that touch.
+    (width, height) = blocked.shape
+    floor = ~blocked
+    starts = floor.copy()
+    starts[:, 1:] &= blocked[:, :-1]
+    runs = np.where(floor, np.cumsum(starts).reshape(width, height) - 1, -1)
+    run_count = int(starts.sum())
+
+    sets = DisjointSet(run_count)
+    for dy in (-1, 0, 1):
+        a = runs[:-1, max(0, -dy):height - max(0, dy)]
+        b = runs[1:, max(0, dy):height - max(0, -dy)]
+        touching = (a >= 0) & (b >= 0)
+        pairs = np.unique(a[touching].astype(np.int64) * run_count + b[touching])
+        for pair in pairs.tolist():
+            sets.union(*divmod(pair, run_count))
+
+    roots = np.array([sets.find(i) for i in range(run_count)], dtype=np.int32)
+    (unique_roots, components) = np.unique(roots, return_inverse=True)
+    labels = np.full((width, height), -1, dtype=np.int32)
+    labels[floor] = components[runs[floor]]
+    return labels, len(unique_roots)
+
+
+def floor_links(labels, count):
+    # where tunnels could join the pieces of floor: breadth first from every floor tile at once, through the walls,
+    # every tile going to the piece that reaches it first. where the tiles of two pieces meet, a tunnel from one
+    # piece's floor tile to the other's is as long as the two distances. the search goes straight only, as the
+    # tunnels of carve_line do, and stops once the links found join all the pieces. the map gets a border, so the
+    # neighbours of a tile are fixed index offsets. returns for every link the pair of pieces (the lowest times
+    # count plus the other), its length and both ends (flat indices into the bordered map).
+    (width, height) = labels.shape
+    padded = np.full((width + 2, height + 2), -2, dtype=np.int32)  # the border counts as reached already
+    padded[1:-1, 1:-1] = labels
+    component = padded.ravel()
+    origin = np.arange(len(component))
+    distance = np.zeros(len(component), dtype=np.int32)
+    offsets = np.array([-(height + 2), -1, 1, height + 2])
+
+    sets = DisjointSet(count)
+    joined = 0
+    (pairs, lengths, starts, ends) = ([], [], [], [])
+    frontier = np.flatnonzero(component >= 0)
+    steps = 0
+    while len(frontier) and joined < count - 1:
+        steps += 1
+        tiles = (frontier[:, None] + offsets).ravel()
+        sources = np.repeat(frontier, len(offsets))
+        new = component[tiles] == -1
+        (frontier, first) = np.unique(tiles[new], return_index=True)
+        sources = sources[new][first]
+        component[frontier] = component[sources]
+        origin[frontier] = origin[sources]
+        distance[frontier] = steps
+
+        for offset in offsets.tolist():
+            neighbours = frontier + offset
+            (a, b) = (component[frontier], component[neighbours])
+            meet = (b >= 0) & (a != b)
+            (a, b) = (a[meet], b[meet])
+            pair = np.minimum(a, b).astype(np.int64) * count + np.maximum(a, b)
+            pairs.append(pair)
+            lengths.append(distance[frontier[meet]] + distance[neighbours[meet]] + 1)
+            starts.append(origin[frontier[meet]])
+            ends.append(origin[neighbours[meet]])
+            for key in np.unique(pair).tolist():
+                if sets.union(*divmod(key, count)):
+                    joined += 1
+    return np.concatenate(pairs), np.concatenate(lengths), np.concatenate(starts), np.concatenate(ends)
+
+
+def connect_floor(blocked, block_sight):
+    # make every piece of floor reachable from every other: of the tunnels that could join two pieces (see
+    # floor_links), the shortest are dug, each one only if its pieces aren't connected yet (they are kept in a
+    # union-find). returns how many tunnels were dug.
+    (labels, count) = floor_components(blocked)
+    if count <= 1:
+        return 0
+    (pairs, lengths, starts, ends) = floor_links(labels, count)
+
+    # the shortest link of every pair of pieces, shortest first
+    order = np.argsort(lengths, kind='stable')
+    first = order[np.sort(np.unique(pairs[order], return_index=True)[1])]
+
+    sets = DisjointSet(count)
+    tunnels = 0
+    stride = blocked.shape[1] + 2
+    for (pair, start, end) in zip(pairs[first].tolist(), starts[first].tolist(), ends[first].tolist()):
+        if not sets.union(*divmod(pair, count)):
+            continue
+        (from_x, from_y) = divmod(start, stride)
+        (to_x, to_y) = divmod(end, stride)
+        carve_line(blocked, from_x - 1, from_y - 1, to_x - 1, to_y - 1)
+        carve_line(block_sight, from_x - 1, from_y - 1, to_x - 1, to_y - 1)
+        tunnels += 1
+    return tunnels
+
+
+def make_cave(width, height, seed, fill=0.45, passes=4, min_region=16):
+    # cellular automata caves: random fill, then a few smoothing passes where a tile becomes a wall if at least 5
+    # of the 9 tiles around it are walls. returns the blocked array (walls block sight as well), with every cave
+    # region that is kept joined to the others.
+    rng = np.random.RandomState(seed)
+    blocked = rng.random_sample((width, height)) < fill
+    for i in range(passes):
+        blocked = neighbour_count(blocked) >= 5
+
+    # keep a solid border, nothing may walk off the map
+    blocked[0, :] = blocked[-1, :] = True
+    blocked[:, 0] = blocked[:, -1] = True
+
+    (labels, count) = label_regions(~blocked)
+    if count > 1:
+        join_regions(blocked, labels, count, rng, min_region)
+    return blocked
+
+
+def floor_tiles(blocked):
+    # (x, y) of every tile that can be walked on
+    (xs, ys) = np.nonzero(~blocked)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def tiles_from_array(blocked, block_sight, tile_class):
+    # build a tile_map out of the arrays
+    blocked = blocked.tolist()
+    block_sight = block_sight.tolist()
+    return [[tile_class(b, s) for (b, s) in zip(blocked_column, sight_column)]
+            for (blocked_column, sight_column) in zip(blocked, block_sight)]
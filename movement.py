@@ -0,0 +1,58 @@
+import numpy as np
+
+# moves of many monsters at once. movers are given in turn order, and the outcome is the same as moving them one
+# after the other in that order with Object.move: a step is taken if the tile is on the map, not blocked, and has
+# no blocking object on it at that point of the turn. there's at most one blocking object per tile to begin with.
+
+
+def chase_steps(xs, ys, x, y):
+    # the step every monster at xs, ys takes towards x, y, rounded the same way as Object.move_towards
+    dx = x - xs
+    dy = y - ys
+    distance = np.sqrt(dx ** 2 + dy ** 2)
+    return np.round(dx / distance).astype(np.int64), np.round(dy / distance).astype(np.int64)
+
+
+def resolve_moves(blocked, static_xs, static_ys, xs, ys, dxs, dys):
+    # which of the movers get to take their step (a bool array). static_xs, static_ys are the blocking objects that
+    # stay put. a tile that is free from the start goes to the first mover that wants it. a tile with a mover on it
+    # goes to the first one wanting it after that mover, and only if the mover gets out, which depends on its own
+    # step: those chains always lead to earlier movers, and are followed by pointer jumping.
+    (width, height) = blocked.shape
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    index = np.arange(len(xs))
+    if not len(xs):
+        return np.zeros(0, dtype=bool)
+
+    to_xs = xs + dxs
+    to_ys = ys + dys
+    inside = (to_xs >= 0) & (to_ys >= 0) & (to_xs < width) & (to_ys < height)
+    to_xs = np.clip(to_xs, 0, width - 1)
+    to_ys = np.clip(to_ys, 0, height - 1)
+    target = to_xs * height + to_ys
+
+    # the mover standing on every target tile, -1 if there's none
+    source = xs * height + ys
+    order = np.argsort(source, kind='stable')
+    found = np.minimum(np.searchsorted(source[order], target), len(xs) - 1)
+    occupant = np.where(source[order][found] == target, order[found], -1)
+
+    static = np.asarray(static_xs, dtype=np.int64) * height + np.asarray(static_ys, dtype=np.int64)
+    open_tile = inside & ~blocked[to_xs, to_ys] & ~np.isin(target, static)
+
+    # the first mover that may want each tile wins it (np.unique gives the first of every value)
+    candidates = np.flatnonzero(open_tile & (index > occupant))
+    (tiles, first) = np.unique(target[candidates], return_index=True)
+    winner = np.zeros(len(xs), dtype=bool)
+    winner[candidates[first]] = True
+
+    # a winner waiting on the mover in its tile moves if the end of its chain does
+    parent = np.where(winner & (occupant >= 0), occupant, index)
+    moves = winner & (occupant < 0)
+    while True:
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+    return moves[parent]
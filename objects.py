@@ -1,9 +1,50 @@
 import libtcodpy as libtcod
 import math
+import weakref
 import globals as g
+import layers
+import storage
 
 
-class Item:
+class Registry:
+    # every Object in memory by its id. ids are handed out once and never reused, so they stay good in saves and
+    # across levels. only weak references are kept: an object that is gone (or only on disk, in a cached level or a
+    # chunk) drops out, and is back under the same id as soon as it's loaded again (see Object.__setstate__).
+    def __init__(self):
+        self.next_id = 1
+        self.entities = weakref.WeakValueDictionary()
+
+    def add(self, obj, id=None):
+        # give an object a new id, or file it under the one it already has
+        if id is None:
+            id = self.next_id
+        self.next_id = max(self.next_id, id + 1)
+        obj.id = id
+        self.entities[id] = obj
+
+    def get(self, id):
+        # the object with an id, None if it's not in memory
+        return self.entities.get(id)
+
+
+registry = Registry()
+store = storage.ColumnStore()  # the data of the objects made in ENTITY_STORAGE = 'columns' mode
+
+
+class Component(object):
+    # the parts of an Object only keep its id, so they can be pickled and passed around without the whole object
+    owner_id = None
+
+    @property
+    def owner(self):
+        return registry.get(self.owner_id)
+
+    @owner.setter
+    def owner(self, obj):
+        self.owner_id = obj.id
+
+
+class Item(Component):
 
     def __init__(self, use_function=None):
         self.use_function = use_function
@@ -47,7 +88,7 @@ class Item:
         g.message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
 
 
-class Fighter:
+class Fighter(Component):
     # combat-related properties and methods (monster, player, NPC).
     def __init__(self, hp, defense, power, xp, death_function=None):
         self.base_power = power
@@ -102,36 +143,40 @@ class Fighter:
             g.message(self.owner.name.capitalize() + ' attacks ' + target.name + ' but it has no effect!')
 
 
-class BasicMonster:
+class BasicMonster(Component):
 
-    def __init__(self):
-        print("whatever")
+    def __init__(self, sight_radius=g.MONSTER_SIGHT_RADIUS):
+        self.sight_radius = sight_radius
 
     # AI for a basic monster.
-    def take_turn(self, fov_map, player, map, objects):
-        # a basic monster takes its turn. If you can see it, it can see you
+    def take_turn(self, perception, player, map, objects):
+        # a basic monster takes its turn, if it can see the player
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
+        if perception.sees(monster, player, self.sight_radius):
 
             # move towards player if far away
             if monster.distance_to(player) >= 2:
-                monster.move_towards(player.x, player.y, map, objects)
+                step = g.chase.step(monster.x, monster.y) if g.chase is not None else None
+                if step is None:
+                    monster.move_towards(player.x, player.y, map, objects)
+                elif step != (0, 0):  # otherwise it waits its turn behind another monster
+                    monster.move(step[0], step[1], map, objects)
 
             # close enough, attack! (if the player is still alive.)
             elif player.fighter.hp > 0:
                 monster.fighter.attack(player, objects, player)
 
 
-class ConfusedMonster:
+class ConfusedMonster(Component):
     # AI for a temporarily confused monster (reverts to previous AI after a while).
     def __init__(self, old_ai, num_turns=g.CONFUSE_NUM_TURNS):
         self.old_ai = old_ai
         self.num_turns = num_turns
 
-    def take_turn(self, fov_map, player, map, objects):
+    def take_turn(self, perception, player, map, objects):
         if self.num_turns > 0:  # still confused...
             # move in a random direction, and decrease the number of turns confused
-            self.owner.move(libtcod.random_get_int(0, -1, 1), libtcod.random_get_int(0, -1, 1), map, objects)
+            wander(self.owner, map, objects)
             self.num_turns -= 1
 
         else:  # restore the previous AI (this one will be deleted because it's not referenced anymore)
@@ -139,7 +184,7 @@ class ConfusedMonster:
             g.message('The ' + self.owner.name + ' is no longer confused!', libtcod.red)
 
 
-class Equipment:
+class Equipment(Component):
     # an object that can be equipped, yielding bonuses. automatically adds the Item component.
     def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0):
         self.power_bonus = power_bonus
@@ -173,7 +218,8 @@ class Equipment:
 class Object:
 
     def __init__(self, x, y, char, name, color, blocks=False, always_visible=False, fighter=None, ai=None, item=None,
-                 level=1, equipment=None):
+                 level=1, equipment=None, layer=None):
+        registry.add(self)
         self.always_visible = always_visible
         self.x = x
         self.y = y
@@ -198,15 +244,25 @@ class Object:
 
         self.level = level
 
+        # the layer it's drawn in, worked out from its components unless given
+        if layer is None:
+            if self.fighter or self.ai:
+                layer = layers.ACTORS
+            elif self.item:
+                layer = layers.ITEMS
+            else:
+                layer = layers.FEATURES
+        self.layer = layer
+
+    def __setstate__(self, state):
+        # an object loaded from a save, a cached level or a chunk is filed under its id again
+        self.__dict__.update(state)
+        registry.add(self, self.id)
+
     def distance(self, x, y):
         # return the distance to some coordinates
         return math.sqrt((x - self.x) ** 2 + (y - self.y) ** 2)
 
-    def send_to_back(self, objects):
-        # make this object be drawn first, so all others appear above it if they're in the same tile.
-        objects.remove(self)
-        objects.insert(0, self)
-
     def move_towards(self, target_x, target_y, map, objects):
         # vector from this object to the target, and distance
         dx = target_x - self.x
@@ -224,15 +280,23 @@ class Object:
         if not is_blocked(self.x + dx, self.y + dy, map, objects):
             self.x += dx
             self.y += dy
-
-    def draw(self, fov_map, tile_map, con):
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or
-                (self.always_visible and tile_map[self.x][self.y].explored)):
+            if self.fighter and g.fighters is not None:
+                g.fighters.update(self)
+            if self.blocks and g.chase is not None:
+                g.chase.moved(self.x - dx, self.y - dy, self.x, self.y)
+
+    def draw(self, visible, tile_map, con):
+        # only draw it if it's inside the camera's view, and visible
+        (x, y) = g.to_camera_coordinates(self.x, self.y)
+        if x is not None and (visible[self.x, self.y] or
+                              (self.always_visible and tile_map[self.x][self.y].explored)):
             libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
+            libtcod.console_put_char(con, x, y, self.char, libtcod.BKGND_NONE)
 
     def clear(self, con):
-        libtcod.console_put_char(con, self.x, self.y, ' ', libtcod.BKGND_NONE)
+        (x, y) = g.to_camera_coordinates(self.x, self.y)
+        if x is not None:
+            libtcod.console_put_char(con, x, y, ' ', libtcod.BKGND_NONE)
 
     def distance_to(self, other):
         # return the distance to another object
@@ -241,6 +305,74 @@ class Object:
         return math.sqrt(dx ** 2 + dy ** 2)
 
 
+class StoredObject(Object, object):
+    # an Object whose position and kind of AI are kept in the column store, by its id
+    x = storage.Column(store, 'x', 'id')
+    y = storage.Column(store, 'y', 'id')
+
+    def __setattr__(self, name, value):
+        # the ai stays a plain attribute, so reading it costs nothing extra; setting it files its kind as well
+        object.__setattr__(self, name, value)
+        if name == 'ai':
+            store.reserve(self.id)
+            store.ai[self.id] = AI_KINDS.get(value.__class__, storage.OTHER_AI) if value else storage.NO_AI
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        (state['x'], state['y']) = (self.x, self.y)
+        return state
+
+    def __setstate__(self, state):
+        (x, y) = (state.pop('x'), state.pop('y'))
+        Object.__setstate__(self, state)
+        (self.x, self.y) = (x, y)
+        self.ai = self.ai
+
+
+class StoredFighter(Fighter):
+    # a Fighter whose numbers are kept in the column store, in its owner's row
+    FIELDS = ['hp', 'base_max_hp', 'base_power', 'base_defense', 'xp']
+    hp = storage.Column(store, 'hp', 'owner_id')
+    base_max_hp = storage.Column(store, 'base_max_hp', 'owner_id')
+    base_power = storage.Column(store, 'base_power', 'owner_id')
+    base_defense = storage.Column(store, 'base_defense', 'owner_id')
+    xp = storage.Column(store, 'xp', 'owner_id')
+
+    @property
+    def owner(self):
+        return registry.get(self.owner_id)
+
+    @owner.setter
+    def owner(self, obj):
+        # the numbers kept while it had no owner move to the owner's row
+        waiting = [(name, self.__dict__.pop(name)) for name in self.FIELDS if name in self.__dict__]
+        self.owner_id = obj.id
+        for (name, value) in waiting:
+            setattr(self, name, value)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.FIELDS:
+            state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        values = [(name, state.pop(name)) for name in self.FIELDS]
+        self.__dict__.update(state)
+        for (name, value) in values:
+            setattr(self, name, value)
+
+
+AI_KINDS = {BasicMonster: storage.BASIC_AI, ConfusedMonster: storage.CONFUSED_AI}
+
+
+def monster_classes():
+    # the Object and Fighter classes monsters are made of, see ENTITY_STORAGE
+    if g.ENTITY_STORAGE == 'columns':
+        return StoredObject, StoredFighter
+    return Object, Fighter
+
+
 def get_equipped_in_slot(slot, inventory):
     # returns the equipment in a slot, or None if it's empty
     for obj in inventory:
@@ -261,6 +393,10 @@ def get_all_equipped(obj, player):  # returns a list of equipped items
 
 
 def is_blocked(x, y, map, objects):
+    # nothing can leave the map
+    if x < 0 or y < 0 or x >= g.MAP_WIDTH or y >= g.MAP_HEIGHT:
+        return True
+
     # first test the map tile
     if map[x][y].blocked:
         return True
@@ -273,6 +409,11 @@ def is_blocked(x, y, map, objects):
     return False
 
 
+def wander(monster, map, objects):
+    # take a step in a random direction
+    monster.move(libtcod.random_get_int(0, -1, 1), libtcod.random_get_int(0, -1, 1), map, objects)
+
+
 def monster_death(monster, objects):
     # transform it into a nasty corpse! it doesn't block, can't be
     # attacked and doesn't move
@@ -285,7 +426,7 @@ def monster_death(monster, objects):
     monster.fighter = None
     monster.ai = None
     monster.name = 'remains of ' + monster.name
-    monster.send_to_back(objects)
+    objects.move(monster, layers.CORPSES)
 
 
 def player_death(player, objects):
@@ -299,21 +440,23 @@ def player_death(player, objects):
 
 
 def create_orc(x, y):
-    orc_fighter_component = Fighter(hp=10, defense=0, power=3, death_function=monster_death, xp=35)
+    (object_class, fighter_class) = monster_classes()
+    orc_fighter_component = fighter_class(hp=10, defense=0, power=3, death_function=monster_death, xp=35)
     ai_component = BasicMonster()
 
-    monster = Object(x, y, 'o', 'orc', libtcod.desaturated_green,
-                     blocks=True, fighter=orc_fighter_component, ai=ai_component)
+    monster = object_class(x, y, 'o', 'orc', libtcod.desaturated_green,
+                           blocks=True, fighter=orc_fighter_component, ai=ai_component)
 
     return monster
 
 
 def create_troll(x, y):
-    troll_fighter_component = Fighter(hp=16, defense=1, power=4, death_function=monster_death, xp=100)
-    ai_component = BasicMonster()
+    (object_class, fighter_class) = monster_classes()
+    troll_fighter_component = fighter_class(hp=16, defense=1, power=4, death_function=monster_death, xp=100)
+    ai_component = BasicMonster(sight_radius=g.TROLL_SIGHT_RADIUS)
 
-    monster = Object(x, y, 'T', 'troll', libtcod.darker_green,
-                     blocks=True, fighter=troll_fighter_component, ai=ai_component)
+    monster = object_class(x, y, 'T', 'troll', libtcod.darker_green,
+                           blocks=True, fighter=troll_fighter_component, ai=ai_component)
 
     return monster
 
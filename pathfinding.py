@@ -0,0 +1,527 @@
+import heapq
+from collections import deque
+
+from explore import DIRECTIONS
+
+# long entrances get a crossing at each end instead of one in the middle
+LONG_ENTRANCE = 6
+
+
+class HierarchicalMap:
+    # hierarchical pathfinding (HPA*): the map is cut into square clusters, and the places where a cluster can be
+    # left for its neighbour (entrances) are linked with the walking distances between them inside every cluster.
+    # a long route is searched on that small graph first, then walked out one cluster at a time. when a tile
+    # changes only its cluster (and the neighbour it borders, for tiles on the edge) is worked out again.
+    def __init__(self, tile_map, width, height, cluster_size):
+        self.width = width
+        self.height = height
+        self.cluster_size = cluster_size
+        self.columns = (width + cluster_size - 1) // cluster_size
+        self.rows = (height + cluster_size - 1) // cluster_size
+
+        self.walkable = [False] * (width * height)  # indexed x + y * width, like the tiles of the abstract graph
+        for x in range(width):
+            for y in range(height):
+                self.walkable[x + y * width] = not tile_map[x][y].blocked
+
+        self.borders = {}  # (cluster, cluster to its right, below or diagonally below) -> [(tile, tile across)]
+        self.crossings = {}  # tile -> tiles across a border it leads to
+        self.edges = {}  # cluster -> {entrance tile: {entrance tile: distance}}
+
+        clusters = range(self.columns * self.rows)
+        self.dirty_borders = set(border for cluster in clusters for border in self.cluster_borders(cluster))
+        self.dirty_clusters = set(clusters)
+
+    def cluster_of(self, i):
+        return (i % self.width) // self.cluster_size + (i // self.width) // self.cluster_size * self.columns
+
+    def cluster_bounds(self, cluster):
+        # x1, y1, x2, y2 of a cluster, the last two excluded
+        x1 = cluster % self.columns * self.cluster_size
+        y1 = cluster // self.columns * self.cluster_size
+        return x1, y1, min(x1 + self.cluster_size, self.width), min(y1 + self.cluster_size, self.height)
+
+    def cluster_borders(self, cluster):
+        # the borders of a cluster with its neighbours, the ones it only touches at a corner included: monsters
+        # step diagonally, so a corner can be the only way through
+        (cx, cy) = (cluster % self.columns, cluster // self.columns)
+        borders = []
+        if cx > 0:
+            borders.append((cluster - 1, cluster))
+        if cx < self.columns - 1:
+            borders.append((cluster, cluster + 1))
+        if cy > 0:
+            borders.append((cluster - self.columns, cluster))
+            if cx > 0:
+                borders.append((cluster - self.columns - 1, cluster))
+            if cx < self.columns - 1:
+                borders.append((cluster - self.columns + 1, cluster))
+        if cy < self.rows - 1:
+            borders.append((cluster, cluster + self.columns))
+            if cx > 0:
+                borders.append((cluster, cluster + self.columns - 1))
+            if cx < self.columns - 1:
+                borders.append((cluster, cluster + self.columns + 1))
+        return borders
+
+    def set_walkable(self, x, y, walkable):
+        # a tile changed: its cluster needs new distances, and its borders new entrances if it's on the edge
+        i = x + y * self.width
+        if self.walkable[i] == walkable:
+            return
+        self.walkable[i] = walkable
+        cluster = self.cluster_of(i)
+        self.dirty_clusters.add(cluster)
+
+        (x1, y1, x2, y2) = self.cluster_bounds(cluster)
+        for (a, b) in self.cluster_borders(cluster):
+            other = b if a == cluster else a
+            (ox1, oy1, ox2, oy2) = self.cluster_bounds(other)
+            # the border is the cluster's column or row of tiles that faces the other cluster, or the corner tile
+            # facing it for a diagonal neighbour
+            facing_x = (ox1 >= x2 and x == x2 - 1) or (ox2 <= x1 and x == x1)
+            facing_y = (oy1 >= y2 and y == y2 - 1) or (oy2 <= y1 and y == y1)
+            if (facing_x or (x1 < ox2 and ox1 < x2)) and (facing_y or (y1 < oy2 and oy1 < y2)):
+                self.dirty_borders.add((a, b))
+                self.dirty_clusters.add(other)
+
+    def find_entrances(self, border):
+        # pairs of walkable tiles facing each other across a border (straight or diagonal). the crossings are grouped
+        # by the stretch of open tiles they start from on either side, so every stretch on the far side gets its
+        # own entrance even where one stretch on this side faces several; one or two per group.
+        (a, b) = border
+        (x1, y1, x2, y2) = self.cluster_bounds(a)
+        (bx1, by1, bx2, by2) = self.cluster_bounds(b)
+        if by1 >= y2 and (bx1 >= x2 or bx2 <= x1):
+            # b is diagonally below: the only crossing is from the corner tile to the one across it
+            (x, y) = (x2 - 1, y2 - 1) if bx1 >= x2 else (x1, y2 - 1)
+            (across_x, across_y) = (x + 1, y + 1) if bx1 >= x2 else (x - 1, y + 1)
+            (tile, across) = (x + y * self.width, across_x + across_y * self.width)
+            if self.walkable[tile] and self.walkable[across]:
+                return [(tile, across)]
+            return []
+        if bx1 >= x2:
+            # b is to the right: walk down the border
+            line = [(x2 - 1, y) for y in range(y1, y2)]
+            (step_x, step_y) = (1, 0)
+        else:
+            line = [(x, y2 - 1) for x in range(x1, x2)]
+            (step_x, step_y) = (0, 1)
+        near = [x + y * self.width for (x, y) in line]
+        far = [x + step_x + (y + step_y) * self.width for (x, y) in line]
+        near_stretches = self.stretches(near)
+        far_stretches = self.stretches(far)
+
+        groups = {}  # (stretch on this side, stretch across) -> [(tile, tile across)], along the border
+        for (k, tile) in enumerate(near):
+            if near_stretches[k] is None:
+                continue
+            for side in (0, -1, 1):
+                if 0 <= k + side < len(far) and far_stretches[k + side] is not None:
+                    key = (near_stretches[k], far_stretches[k + side])
+                    groups.setdefault(key, []).append((tile, far[k + side]))
+
+        entrances = []
+        for key in sorted(groups):
+            run = groups[key]
+            if len(run) >= LONG_ENTRANCE:
+                entrances.extend((run[0], run[-1]))
+            else:
+                entrances.append(run[len(run) // 2])
+        return entrances
+
+    def stretches(self, tiles):
+        # the number of the stretch of walkable tiles every tile of a line is in, None for the others
+        numbers = []
+        count = 0
+        previous = False
+        for tile in tiles:
+            walkable = self.walkable[tile]
+            if walkable and not previous:
+                count += 1
+            numbers.append(count if walkable else None)
+            previous = walkable
+        return numbers
+
+    def update(self):
+        # work out the dirty borders' entrances, then the distances inside the dirty clusters
+        for border in self.dirty_borders:
+            for (tile, across) in self.borders.get(border, []):
+                self.crossings[tile].discard(across)
+                self.crossings[across].discard(tile)
+            self.borders[border] = self.find_entrances(border)
+            for (tile, across) in self.borders[border]:
+                self.crossings.setdefault(tile, set()).add(across)
+                self.crossings.setdefault(across, set()).add(tile)
+        self.dirty_borders = set()
+
+        for cluster in self.dirty_clusters:
+            entrances = set()
+            for border in self.cluster_borders(cluster):
+                for (tile, across) in self.borders[border]:
+                    entrances.add(tile if border[0] == cluster else across)
+            edges = {}
+            for tile in entrances:
+                distance = self.search(tile, cluster)[0]
+                edges[tile] = dict((other, distance[other]) for other in entrances
+                                   if other != tile and other in distance)
+            self.edges[cluster] = edges
+        self.dirty_clusters = set()
+
+    def search(self, start, cluster, goal=None):
+        # breadth first search inside a cluster. returns the distance and the previous tile of every tile reached,
+        # stopping early at the goal if there is one
+        (x1, y1, x2, y2) = self.cluster_bounds(cluster)
+        distance = {start: 0}
+        previous = {}
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            if i == goal:
+                break
+            (x, y) = (i % self.width, i // self.width)
+            for (dx, dy) in DIRECTIONS:
+                (nx, ny) = (x + dx, y + dy)
+                n = nx + ny * self.width
+                if x1 <= nx < x2 and y1 <= ny < y2 and n not in distance and self.walkable[n]:
+                    distance[n] = distance[i] + 1
+                    previous[n] = i
+                    queue.append(n)
+        return distance, previous
+
+    def local_path(self, start, goal, cluster):
+        # the tiles from start (excluded) to goal inside a cluster, or None
+        (distance, previous) = self.search(start, cluster, goal)
+        if goal not in distance:
+            return None
+        tiles = []
+        while goal != start:
+            tiles.append(goal)
+            goal = previous[goal]
+        tiles.reverse()
+        return tiles
+
+    def path(self, x1, y1, x2, y2):
+        # the (x, y) of every step from x1, y1 to x2, y2 (the start not included), or None if there's no way
+        self.update()
+        start = x1 + y1 * self.width
+        goal = x2 + y2 * self.width
+        if start == goal:
+            return []
+        if not self.walkable[goal]:
+            return None
+        start_cluster = self.cluster_of(start)
+        goal_cluster = self.cluster_of(goal)
+        if start_cluster == goal_cluster:
+            tiles = self.local_path(start, goal, start_cluster)
+            if tiles is not None:
+                return [(i % self.width, i // self.width) for i in tiles]
+
+        # the start and goal are linked to the entrances of their clusters for this search only
+        start_edges = self.search(start, start_cluster)[0]
+        start_edges = dict((tile, start_edges[tile]) for tile in self.edges[start_cluster] if tile in start_edges)
+        goal_edges = self.search(goal, goal_cluster)[0]
+        goal_edges = dict((tile, goal_edges[tile]) for tile in self.edges[goal_cluster] if tile in goal_edges)
+
+        def heuristic(i):
+            return max(abs(i % self.width - x2), abs(i // self.width - y2))
+
+        cost = {start: 0}
+        previous = {}
+        heap = [(heuristic(start), 0, start)]
+        while heap:
+            (f, d, i) = heapq.heappop(heap)
+            if i == goal:
+                break
+            if d > cost[i]:
+                continue
+            if i == start:
+                links = list(start_edges.items())
+            else:
+                links = list(self.edges[self.cluster_of(i)][i].items())
+            links.extend((across, 1) for across in self.crossings.get(i, ()))
+            if i in goal_edges:
+                links.append((goal, goal_edges[i]))
+            for (n, step) in links:
+                if d + step < cost.get(n, d + step + 1):
+                    cost[n] = d + step
+                    previous[n] = i
+                    heapq.heappush(heap, (d + step + heuristic(n), d + step, n))
+
+        if goal not in cost:
+            return None
+
+        # walk the abstract route out, one cluster at a time
+        route = [goal]
+        while route[-1] != start:
+            route.append(previous[route[-1]])
+        route.reverse()
+        tiles = []
+        for (a, b) in zip(route, route[1:]):
+            cluster = self.cluster_of(a)
+            if cluster == self.cluster_of(b):
+                tiles.extend(self.local_path(a, b, cluster))
+            else:
+                tiles.append(b)
+        return [(i % self.width, i // self.width) for i in tiles]
+
+
+DIAGONAL_COST = 1.41  # the same as the travel paths libtcod computes
+
+
+class JumpPointPath:
+    # jump point search: A* on a grid where every move costs the same, that skips along straight and diagonal lines
+    # and only stops on tiles where a wall opens up a new way (jump points), so open rooms cost next to nothing.
+    # it's pure python and used like a libtcod path: compute, then size/get/walk.
+    def __init__(self, tile_map, width, height):
+        self.width = width
+        self.height = height
+        self.walkable = [False] * (width * height)
+        for x in range(width):
+            for y in range(height):
+                self.walkable[x + y * width] = not tile_map[x][y].blocked
+        self.origin = None
+        self.destination = None
+        self.steps = []
+
+    def set_walkable(self, x, y, walkable):
+        self.walkable[x + y * self.width] = walkable
+
+    def is_open(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height and self.walkable[x + y * self.width]
+
+    def neighbours(self, x, y, dx, dy):
+        # the directions worth looking at after arriving at x, y going dx, dy: the natural ones, and the forced
+        # ones a wall next to the way in opened up
+        if dx == 0 and dy == 0:
+            return DIRECTIONS
+        is_open = self.is_open
+        directions = []
+        if dx != 0 and dy != 0:
+            if is_open(x + dx, y):
+                directions.append((dx, 0))
+            if is_open(x, y + dy):
+                directions.append((0, dy))
+            if is_open(x + dx, y + dy):
+                directions.append((dx, dy))
+            if not is_open(x - dx, y) and is_open(x - dx, y + dy):
+                directions.append((-dx, dy))
+            if not is_open(x, y - dy) and is_open(x + dx, y - dy):
+                directions.append((dx, -dy))
+        elif dx != 0:
+            if is_open(x + dx, y):
+                directions.append((dx, 0))
+            for side in (-1, 1):
+                if not is_open(x, y + side) and is_open(x + dx, y + side):
+                    directions.append((dx, side))
+        else:
+            if is_open(x, y + dy):
+                directions.append((0, dy))
+            for side in (-1, 1):
+                if not is_open(x + side, y) and is_open(x + side, y + dy):
+                    directions.append((side, dy))
+        return directions
+
+    def jump(self, x, y, dx, dy, goal_x, goal_y):
+        # keep going from x, y in one direction; returns the next jump point, or None if it runs into a wall
+        is_open = self.is_open
+        while True:
+            x += dx
+            y += dy
+            if not is_open(x, y):
+                return None
+            if x == goal_x and y == goal_y:
+                return x, y
+            if dx != 0 and dy != 0:
+                if (not is_open(x - dx, y) and is_open(x - dx, y + dy)) or \
+                        (not is_open(x, y - dy) and is_open(x + dx, y - dy)):
+                    return x, y
+                # a diagonal stops wherever one of its straight lines would find something
+                if self.jump(x, y, dx, 0, goal_x, goal_y) is not None or \
+                        self.jump(x, y, 0, dy, goal_x, goal_y) is not None:
+                    return x, y
+            elif dx != 0:
+                if (not is_open(x, y - 1) and is_open(x + dx, y - 1)) or \
+                        (not is_open(x, y + 1) and is_open(x + dx, y + 1)):
+                    return x, y
+            else:
+                if (not is_open(x - 1, y) and is_open(x - 1, y + dy)) or \
+                        (not is_open(x + 1, y) and is_open(x + 1, y + dy)):
+                    return x, y
+
+    def compute(self, origin_x, origin_y, dest_x, dest_y):
+        # like libtcod.path_compute: returns whether there is a path, and keeps its steps (origin not included)
+        self.origin = (origin_x, origin_y)
+        self.destination = (dest_x, dest_y)
+        self.steps = []
+        if not self.is_open(dest_x, dest_y):
+            return False
+
+        def heuristic(x, y):
+            (ax, ay) = (abs(x - dest_x), abs(y - dest_y))
+            return max(ax, ay) + (DIAGONAL_COST - 1) * min(ax, ay)
+
+        start = (origin_x, origin_y)
+        cost = {start: 0}
+        previous = {start: None}
+        heap = [(heuristic(origin_x, origin_y), 0, start)]
+        while heap:
+            (f, d, point) = heapq.heappop(heap)
+            if point == self.destination:
+                break
+            if d > cost[point]:
+                continue
+            (x, y) = point
+            parent = previous[point]
+            if parent is None:
+                (dx, dy) = (0, 0)
+            else:
+                dx = (x > parent[0]) - (x < parent[0])
+                dy = (y > parent[1]) - (y < parent[1])
+            for (ndx, ndy) in self.neighbours(x, y, dx, dy):
+                found = self.jump(x, y, ndx, ndy, dest_x, dest_y)
+                if found is None:
+                    continue
+                (ax, ay) = (abs(found[0] - x), abs(found[1] - y))
+                new_cost = d + max(ax, ay) + (DIAGONAL_COST - 1) * min(ax, ay)
+                if new_cost < cost.get(found, new_cost + 1):
+                    cost[found] = new_cost
+                    previous[found] = point
+                    heapq.heappush(heap, (new_cost + heuristic(found[0], found[1]), new_cost, found))
+
+        if self.destination not in cost:
+            return False
+
+        # fill in the tiles between the jump points
+        point = self.destination
+        while previous[point] is not None:
+            parent = previous[point]
+            dx = (point[0] > parent[0]) - (point[0] < parent[0])
+            dy = (point[1] > parent[1]) - (point[1] < parent[1])
+            (x, y) = point
+            while (x, y) != parent:
+                self.steps.append((x, y))
+                (x, y) = (x - dx, y - dy)
+            point = parent
+        self.steps.reverse()
+        return True
+
+    def size(self):
+        return len(self.steps)
+
+    def get(self, index):
+        return self.steps[index]
+
+    def is_empty(self):
+        return not self.steps
+
+    def walk(self):
+        # like libtcod.path_walk: the next step, taken off the path, or (None, None) at the end
+        if not self.steps:
+            return None, None
+        return self.steps.pop(0)
+
+
+class ChasePlanner:
+    # cooperative chasing: the monsters going for the same target share one map of walking distances to it, and
+    # book the tiles they are going to be on for the next few turns in a space-time reservation table, so the ones
+    # behind queue up or take another way down instead of bumping into the ones in front. the distances are only
+    # worked out again when the target moves, the table is started over every turn (see begin_turn). the blocking
+    # objects are where begin_turn was told, and then wherever moved() says they went.
+    def __init__(self, tile_map, width, height, window, max_distance):
+        self.width = width
+        self.height = height
+        self.window = window  # how many turns ahead the tiles are booked
+        self.max_distance = max_distance  # tiles farther away than this are left out of the distance map
+        self.walkable = [False] * (width * height)
+        for x in range(width):
+            for y in range(height):
+                self.walkable[x + y * width] = not tile_map[x][y].blocked
+        self.target = None
+        self.distance = {}  # (x, y) -> steps to the target, for the tiles within max_distance
+        self.occupied = set()
+        self.reserved = set()  # (x, y, turns from now) booked by a monster
+        self.moves = set()  # ((from x, from y), (to x, to y), turns from now), so no two monsters swap places
+
+    def set_walkable(self, x, y, walkable):
+        self.walkable[x + y * self.width] = walkable
+        self.target = None
+
+    def begin_turn(self, target_x, target_y, occupied):
+        # a new turn: the positions of all the blocking objects, and the table emptied
+        if self.target != (target_x, target_y):
+            self.target = (target_x, target_y)
+            self.compute_distances()
+        self.occupied = set(occupied)
+        self.reserved = set()
+        self.moves = set()
+
+    def compute_distances(self):
+        # breadth-first from the target, moving like the monsters do (diagonals included)
+        self.distance = {self.target: 0}
+        queue = deque([self.target])
+        while queue:
+            (x, y) = queue.popleft()
+            distance = self.distance[(x, y)] + 1
+            if distance > self.max_distance:
+                break
+            for (dx, dy) in DIRECTIONS:
+                (nx, ny) = (x + dx, y + dy)
+                if (0 <= nx < self.width and 0 <= ny < self.height and self.walkable[nx + ny * self.width] and
+                        (nx, ny) not in self.distance):
+                    self.distance[(nx, ny)] = distance
+                    queue.append((nx, ny))
+
+    def step(self, x, y):
+        # plan the next window turns of the monster at x, y, and return its step for this one: (0, 0) to wait in
+        # line, or None if it's too far to be in the distance map. monsters plan in turn order, the earlier ones
+        # have their way; each one goes down the distance map to the free tile closest to the target, or steps aside
+        # when that's the way around the monsters in front.
+        if (x, y) not in self.distance:
+            return None
+        (target_x, target_y) = self.target
+        path = [(x, y)]
+        for t in range(1, self.window + 1):
+            (cx, cy) = path[-1]
+            here = self.distance[(cx, cy)]
+            (best, best_key) = ((cx, cy), None)
+            for (dx, dy) in DIRECTIONS:
+                tile = (cx + dx, cy + dy)
+                if tile == self.target or self.distance.get(tile, here + 1) > here:
+                    continue
+                if self.distance[tile] == here and not self.opening(tile, here):
+                    continue
+                if (tile[0], tile[1], t) in self.reserved or (tile, (cx, cy), t) in self.moves:
+                    continue
+                if t == 1 and tile in self.occupied:
+                    continue
+                # the closest to the target, and of those the one most in line with it
+                key = (self.distance[tile], (tile[0] - target_x) ** 2 + (tile[1] - target_y) ** 2)
+                if best_key is None or key < best_key:
+                    (best, best_key) = (tile, key)
+            self.reserved.add((best[0], best[1], t))
+            if best != (cx, cy):
+                self.moves.add(((cx, cy), best, t))
+            path.append(best)
+        return path[1][0] - x, path[1][1] - y
+
+    def free(self, x, y):
+        # whether a step onto a tile would be taken right now
+        return (0 <= x < self.width and 0 <= y < self.height and self.walkable[x + y * self.width] and
+                (x, y) not in self.occupied)
+
+    def moved(self, x, y, new_x, new_y):
+        # a blocking object went from x, y to new_x, new_y. only moves that were made are told, so the monsters
+        # planning after it see the tiles as they are
+        self.occupied.discard((x, y))
+        self.occupied.add((new_x, new_y))
+
+    def opening(self, tile, distance):
+        # whether a tile leads to a free one closer than distance: stepping aside to it gets around the monsters
+        # in the way, instead of waiting behind them
+        for (dx, dy) in DIRECTIONS:
+            next_tile = (tile[0] + dx, tile[1] + dy)
+            if (next_tile != self.target and self.distance.get(next_tile, distance) < distance and
+                    next_tile not in self.occupied):
+                return True
+        return False
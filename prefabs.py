@@ -0,0 +1,137 @@
+import os
+import bisect
+
+import numpy as np
+import libtcodpy as libtcod
+
+# what every character of a prefab stands for: (blocked, block_sight), None leaves the map as it is
+LEGEND = {
+    '#': (True, True),
+    '"': (True, False),
+    '.': (False, False),
+    'M': (False, False),
+    'I': (False, False),
+    ' ': None,
+}
+
+
+class Prefab:
+    # a room template, compiled to arrays that can be stamped straight into the map arrays
+    def __init__(self, name, rows):
+        self.name = name
+        self.width = max(len(row) for row in rows)
+        self.height = len(rows)
+
+        # all indexed [x, y], like the map
+        self.mask = np.zeros((self.width, self.height), dtype=bool)  # the tiles the prefab sets
+        self.blocked = np.zeros((self.width, self.height), dtype=bool)
+        self.block_sight = np.zeros((self.width, self.height), dtype=bool)
+        self.monster_spots = []
+        self.item_spots = []
+
+        for (y, row) in enumerate(rows):
+            for (x, char) in enumerate(row):
+                if char not in LEGEND:
+                    raise ValueError('Unknown character ' + repr(char) + ' in prefab ' + name + '.')
+                if LEGEND[char] is None:
+                    continue
+                self.mask[x, y] = True
+                (self.blocked[x, y], self.block_sight[x, y]) = LEGEND[char]
+                if char == 'M':
+                    self.monster_spots.append((x, y))
+                elif char == 'I':
+                    self.item_spots.append((x, y))
+
+    def mirrored(self, flip_x, flip_y):
+        # the same prefab, flipped horizontally and/or vertically
+        prefab = Prefab.__new__(Prefab)
+        prefab.name = self.name
+        (prefab.width, prefab.height) = (self.width, self.height)
+        sx = slice(None, None, -1 if flip_x else 1)
+        sy = slice(None, None, -1 if flip_y else 1)
+        prefab.mask = self.mask[sx, sy].copy()
+        prefab.blocked = self.blocked[sx, sy].copy()
+        prefab.block_sight = self.block_sight[sx, sy].copy()
+
+        def flip(spots):
+            return [(self.width - 1 - x if flip_x else x, self.height - 1 - y if flip_y else y) for (x, y) in spots]
+        prefab.monster_spots = flip(self.monster_spots)
+        prefab.item_spots = flip(self.item_spots)
+        return prefab
+
+    def stamp(self, blocked, block_sight, x, y):
+        # write the prefab into the map arrays, with its top-left corner at x, y
+        area = (slice(x, x + self.width), slice(y, y + self.height))
+        blocked[area] = np.where(self.mask, self.blocked, blocked[area])
+        block_sight[area] = np.where(self.mask, self.block_sight, block_sight[area])
+
+
+def parse_text(text):
+    # returns (name, rows) for every prefab in a text file. lines starting with ; are comments
+    prefabs = []
+    for line in text.splitlines():
+        line = line.rstrip('\r\n')
+        if line.startswith(';'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            prefabs.append((line[1:-1], []))
+        elif line.strip() and prefabs:
+            prefabs[-1][1].append(line)
+    return prefabs
+
+
+def parse_xp(filename):
+    # a REXPaint image is one prefab, named after the file, read with the same legend as the text files
+    con = libtcod.console_from_xp(filename)
+    rows = []
+    for y in range(libtcod.console_get_height(con)):
+        rows.append(''.join(chr(libtcod.console_get_char(con, x, y))
+                            for x in range(libtcod.console_get_width(con))).rstrip('\0'))
+    libtcod.console_delete(con)
+    return os.path.splitext(os.path.basename(filename))[0], rows
+
+
+class PrefabLibrary:
+    # every prefab in a directory (and its mirror images), indexed by size so a room only looks at the ones that fit
+    def __init__(self, directory):
+        self.by_size = {}  # (width, height) -> prefabs
+        self.fitting_cache = {}
+
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith('.txt'):
+                with open(path) as f:
+                    templates = parse_text(f.read())
+            elif name.endswith('.xp'):
+                templates = [parse_xp(path)]
+            else:
+                continue
+            for (prefab_name, rows) in templates:
+                prefab = Prefab(prefab_name, rows)
+                for flip_x in (False, True):
+                    for flip_y in (False, True):
+                        self.by_size.setdefault((prefab.width, prefab.height), []).append(
+                            prefab.mirrored(flip_x, flip_y))
+
+        self.sizes = sorted(self.by_size.keys())
+
+    def fitting(self, width, height):
+        # all the prefabs that fit in a width x height area
+        key = (width, height)
+        if key not in self.fitting_cache:
+            prefabs = []
+            for size in self.sizes[:bisect.bisect_right(self.sizes, (width, height + 1))]:
+                if size[1] <= height:
+                    prefabs.extend(self.by_size[size])
+            self.fitting_cache[key] = prefabs
+        return self.fitting_cache[key]
+
+
+libraries = {}
+
+
+def library(directory):
+    # prefabs are compiled once, the first time a directory is asked for
+    if directory not in libraries:
+        libraries[directory] = PrefabLibrary(directory)
+    return libraries[directory]
@@ -0,0 +1,66 @@
+from collections import deque
+
+import numpy as np
+
+import mapgen
+
+
+class RegionMap:
+    # which room every tile is in and which rooms are joined to which, worked out once when the level is made so
+    # the game can look them up instead of flood filling the map
+    def __init__(self, rooms, room_map, blocked):
+        self.rooms = rooms  # the Rect of every room, by room id
+        self.room_map = room_map  # the room id of every tile, -1 outside the rooms
+        self.links = [set() for room in rooms]  # the rooms every room leads to without passing through another one
+
+        # every piece of floor outside the rooms (tunnels, caves) is numbered after the rooms
+        count = len(rooms)
+        floor = ~blocked
+        (passages, passage_count) = mapgen.label_regions(floor & (room_map < 0))
+        node = np.where(room_map >= 0, room_map, np.where(passages >= 0, passages + count, -1))
+        node[blocked] = -1
+
+        # pairs of different pieces that touch, looking at each tile's neighbours to the right and below
+        (width, height) = node.shape
+        pairs = []
+        for (dx, dy) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            a = node[max(0, -dx):width - max(0, dx), max(0, -dy):height - max(0, dy)]
+            b = node[max(0, dx):width - max(0, -dx), max(0, dy):height - max(0, -dy)]
+            touching = (a >= 0) & (b >= 0) & (a != b)
+            pairs.append(np.minimum(a[touching], b[touching]).astype(np.int64) * (count + passage_count) +
+                         np.maximum(a[touching], b[touching]))
+        pairs = np.unique(np.concatenate(pairs))
+
+        # rooms touching each other are linked, and so are all the rooms a passage leads to
+        passage_rooms = [set() for i in range(passage_count)]
+        for pair in pairs.tolist():
+            (a, b) = divmod(pair, count + passage_count)
+            if b < count:
+                self.links[a].add(b)
+                self.links[b].add(a)
+            elif a < count:
+                passage_rooms[b - count].add(a)
+        for touched in passage_rooms:
+            for a in touched:
+                self.links[a].update(touched)
+                self.links[a].discard(a)
+
+    def room_at(self, x, y):
+        # the id of the room a tile is in, or -1
+        return int(self.room_map[x, y])
+
+    def neighbours(self, room):
+        return self.links[room]
+
+    def hops(self, start):
+        # how many rooms away every room is from the start room, -1 for the ones that can't be reached
+        distance = [-1] * len(self.rooms)
+        distance[start] = 0
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            for other in self.links[room]:
+                if distance[other] < 0:
+                    distance[other] = distance[room] + 1
+                    queue.append(other)
+        return distance
@@ -0,0 +1,72 @@
+import math
+
+disks = {}  # radius -> offsets, see disk()
+
+
+def disk(radius):
+    # the (dx, dy) offsets of every tile within radius of a tile, closest first. worked out once per radius
+    if radius not in disks:
+        reach = int(math.floor(radius))
+        offsets = [(dx * dx + dy * dy, dx, dy) for dx in range(-reach, reach + 1) for dy in range(-reach, reach + 1)
+                   if dx * dx + dy * dy <= radius * radius]
+        offsets.sort()
+        disks[radius] = [(dx, dy) for (distance, dx, dy) in offsets]
+    return disks[radius]
+
+
+class SpatialIndex:
+    # the fighters of a level filed by the tile they stand on, so the ones around a tile are found by looking at
+    # the tiles around it: a query costs as much as the area it covers, however many objects the level has.
+    # fighters are filed again whenever they move (see Object.move); the ones that died are dropped as they're met.
+    def __init__(self, objects):
+        self.buckets = {}  # (x, y) -> fighters there
+        self.where = {}  # fighter -> the (x, y) it's filed under
+        for obj in objects:
+            if obj.fighter:
+                self.update(obj)
+
+    def update(self, obj, x=None, y=None):
+        # file a fighter under the tile it's on now, which can be given if it's at hand already
+        old = self.where.get(obj)
+        new = (obj.x, obj.y) if x is None else (x, y)
+        if old == new:
+            return
+        if old is not None:
+            self.remove(obj)
+        self.buckets.setdefault(new, []).append(obj)
+        self.where[obj] = new
+
+    def remove(self, obj):
+        position = self.where.pop(obj, None)
+        if position is not None:
+            bucket = self.buckets[position]
+            bucket.remove(obj)
+            if not bucket:
+                del self.buckets[position]
+
+    def fighters_at(self, position):
+        bucket = self.buckets.get(position)
+        if not bucket:
+            return []
+        for obj in [obj for obj in bucket if not obj.fighter]:
+            self.remove(obj)
+        return self.buckets.get(position, [])
+
+    def at(self, x, y):
+        # the fighters on a tile
+        return list(self.fighters_at((x, y)))
+
+    def within(self, x, y, radius, accept=None, limit=None):
+        # the fighters within radius of x, y that accept() lets through, closest first, stopping at limit of them
+        found = []
+        for (dx, dy) in disk(radius):
+            for obj in self.fighters_at((x + dx, y + dy)):
+                if accept is None or accept(obj):
+                    found.append(obj)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def in_view(self, x, y, radius, visible, accept=None, limit=None):
+        # the fighters within radius that are in the FOV
+        return self.within(x, y, radius, lambda obj: visible[obj.x, obj.y] and (accept is None or accept(obj)), limit)
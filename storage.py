@@ -0,0 +1,81 @@
+import numpy as np
+
+# what the ai column holds
+NO_AI = 0
+BASIC_AI = 1
+CONFUSED_AI = 2
+OTHER_AI = 3
+
+# the columns of the store, one numpy array each
+COLUMNS = [('x', np.int32), ('y', np.int32), ('hp', np.int32), ('base_max_hp', np.int32), ('base_power', np.int32),
+           ('base_defense', np.int32), ('xp', np.int32), ('ai', np.int8)]
+
+
+class ColumnStore:
+    # component data kept in one array per field, indexed by entity id, instead of in the attributes of one python
+    # object per entity: a system goes over thousands of entities with a few array operations. the objects that
+    # keep their data here are views on it (see StoredObject and StoredFighter), so the rest of the game sees no
+    # difference.
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        for (name, dtype) in COLUMNS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def reserve(self, id):
+        # make room for an id, doubling the columns when they're too short
+        if id < self.capacity:
+            return
+        capacity = self.capacity
+        while capacity <= id:
+            capacity *= 2
+        for (name, dtype) in COLUMNS:
+            column = np.zeros(capacity, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.capacity = capacity
+
+    def positions(self, ids):
+        # the x and y of a batch of entities, as arrays
+        ids = np.asarray(ids, dtype=np.int64)
+        return self.x[ids], self.y[ids]
+
+    def heal(self, ids, amount):
+        # heal a batch of entities by the same amount, without going over their base maximum
+        ids = np.asarray(ids, dtype=np.int64)
+        self.hp[ids] = np.minimum(self.hp[ids] + amount, self.base_max_hp[ids])
+
+    def ai_kinds(self, ids):
+        # the kind of AI of a batch of entities (see NO_AI...)
+        return self.ai[np.asarray(ids, dtype=np.int64)]
+
+    def move(self, ids, dxs, dys):
+        # move a batch of entities by their own steps
+        ids = np.asarray(ids, dtype=np.int64)
+        self.x[ids] += dxs
+        self.y[ids] += dys
+
+
+class Column(object):
+    # an attribute of a view that lives in a column of the store, in the row of the entity's id (read from the
+    # view's id_attribute, an instance attribute). until the view has an id, e.g. a component not yet given to an
+    # object, the value waits in the instance.
+    def __init__(self, store, name, id_attribute):
+        self.store = store
+        self.name = name
+        self.id_attribute = id_attribute
+
+    def __get__(self, view, cls):
+        if view is None:
+            return self
+        id = view.__dict__.get(self.id_attribute)
+        if id is None:
+            return view.__dict__[self.name]
+        return getattr(self.store, self.name).item(id)
+
+    def __set__(self, view, value):
+        id = view.__dict__.get(self.id_attribute)
+        if id is None:
+            view.__dict__[self.name] = value
+            return
+        self.store.reserve(id)
+        getattr(self.store, self.name)[id] = value
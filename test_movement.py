@@ -0,0 +1,70 @@
+import math
+import unittest
+
+import numpy as np
+
+import movement
+
+
+def sequential_moves(blocked, static, movers):
+    # the reference: every mover in turn takes its step if the tile is on the map, not blocked and free right then
+    (width, height) = blocked.shape
+    occupied = set(static) | set((x, y) for (x, y, dx, dy) in movers)
+    moves = []
+    for (x, y, dx, dy) in movers:
+        (to_x, to_y) = (x + dx, y + dy)
+        if 0 <= to_x < width and 0 <= to_y < height and not blocked[to_x, to_y] and (to_x, to_y) not in occupied:
+            occupied.discard((x, y))
+            occupied.add((to_x, to_y))
+            moves.append(True)
+        else:
+            moves.append(False)
+    return moves
+
+
+class ResolveMovesTest(unittest.TestCase):
+    def test_same_as_sequential(self):
+        rng = np.random.RandomState(0)
+        for trial in range(3000):
+            (width, height) = rng.randint(3, 15, 2)
+            blocked = rng.random_sample((width, height)) < rng.random_sample() * 0.4
+            tiles = [(x, y) for x in range(width) for y in range(height) if not blocked[x, y]]
+            rng.shuffle(tiles)
+            count = rng.randint(0, len(tiles) + 1)
+            static_count = rng.randint(0, count + 1)
+            static = tiles[:static_count]
+            movers = []
+            for (x, y) in tiles[static_count:count]:
+                (dx, dy) = rng.randint(-1, 2, 2).tolist()
+                if (dx, dy) != (0, 0):
+                    movers.append((x, y, dx, dy))
+            rng.shuffle(movers)
+
+            steps = np.array(movers, dtype=np.int64).reshape(-1, 4)
+            moves = movement.resolve_moves(blocked, [x for (x, y) in static], [y for (x, y) in static],
+                                           steps[:, 0], steps[:, 1], steps[:, 2], steps[:, 3])
+            self.assertEqual(moves.tolist(), sequential_moves(blocked, static, movers))
+
+    def test_queue_down_a_corridor(self):
+        # a line of movers all stepping the same way: if the front one goes first, they all follow it
+        count = 1000
+        blocked = np.zeros((count + 1, 1), dtype=bool)
+        (xs, ys) = (np.arange(count), np.zeros(count, dtype=np.int64))
+        (dxs, dys) = (np.ones(count, dtype=np.int64), np.zeros(count, dtype=np.int64))
+        self.assertTrue(movement.resolve_moves(blocked, [], [], xs[::-1], ys, dxs, dys).all())
+        self.assertEqual(movement.resolve_moves(blocked, [], [], xs, ys, dxs, dys).sum(), 1)
+
+
+class ChaseStepsTest(unittest.TestCase):
+    def test_same_as_move_towards(self):
+        (xs, ys) = np.meshgrid(np.arange(-30, 31), np.arange(-30, 31))
+        far = xs ** 2 + ys ** 2 >= 4
+        (xs, ys) = (xs[far], ys[far])
+        (dxs, dys) = movement.chase_steps(xs, ys, 0, 0)
+        for (x, y, dx, dy) in zip(xs.tolist(), ys.tolist(), dxs.tolist(), dys.tolist()):
+            distance = math.sqrt(x ** 2 + y ** 2)
+            self.assertEqual((dx, dy), (int(round(-x / distance)), int(round(-y / distance))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import random
+import unittest
+from collections import deque
+
+import pathfinding
+from explore import DIRECTIONS
+
+
+class Tile:
+    def __init__(self, blocked):
+        self.blocked = blocked
+
+
+def tile_map(rows):
+    # a map from rows of text, '#' for walls
+    return [[Tile(rows[y][x] == '#') for y in range(len(rows))] for x in range(len(rows[0]))]
+
+
+def reachable(tiles, width, height, start, goal):
+    # the reference: breadth first search over the whole map, moving like Object.move does
+    seen = set([start])
+    queue = deque([start])
+    while queue:
+        (x, y) = queue.popleft()
+        if (x, y) == goal:
+            return True
+        for (dx, dy) in DIRECTIONS:
+            (nx, ny) = (x + dx, y + dy)
+            if 0 <= nx < width and 0 <= ny < height and not tiles[nx][ny].blocked and (nx, ny) not in seen:
+                seen.add((nx, ny))
+                queue.append((nx, ny))
+    return False
+
+
+class HierarchicalMapTest(unittest.TestCase):
+    def assertWalks(self, tiles, path, start, goal):
+        self.assertIsNotNone(path)
+        self.assertEqual(path[-1], goal)
+        previous = start
+        for (x, y) in path:
+            self.assertEqual(max(abs(x - previous[0]), abs(y - previous[1])), 1)
+            self.assertFalse(tiles[x][y].blocked)
+            previous = (x, y)
+
+    def test_diagonal_step_across_a_cluster_corner(self):
+        # the only way down is the step from (1, 3) to (2, 4), which goes from one cluster to the one diagonally
+        # below it
+        tiles = tile_map(['..#'] * 4 + ['##.'] * 3)
+        path = pathfinding.HierarchicalMap(tiles, 3, 7, 2).path(0, 0, 2, 6)
+        self.assertWalks(tiles, path, (0, 0), (2, 6))
+
+    def test_same_as_breadth_first(self):
+        rng = random.Random(0)
+        for trial in range(200):
+            (width, height) = (rng.randint(3, 20), rng.randint(3, 20))
+            density = rng.uniform(0.2, 0.6)
+            tiles = [[Tile(rng.random() < density) for y in range(height)] for x in range(width)]
+            hierarchy = pathfinding.HierarchicalMap(tiles, width, height, rng.choice([2, 3, 4, 5]))
+            for query in range(10):
+                # tiles change between the queries, like doors opening and walls being dug
+                (x, y) = (rng.randrange(width), rng.randrange(height))
+                tiles[x][y].blocked = not tiles[x][y].blocked
+                hierarchy.set_walkable(x, y, not tiles[x][y].blocked)
+
+                free = [(x, y) for x in range(width) for y in range(height) if not tiles[x][y].blocked]
+                if len(free) < 2:
+                    continue
+                (start, goal) = rng.sample(free, 2)
+                path = hierarchy.path(start[0], start[1], goal[0], goal[1])
+                if reachable(tiles, width, height, start, goal):
+                    self.assertWalks(tiles, path, start, goal)
+                else:
+                    self.assertIsNone(path)
+
+
+if __name__ == '__main__':
+    unittest.main()